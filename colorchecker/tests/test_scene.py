@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+import ty_colorchecker_v2
+import ty_spectral
+
+def new_core(checker, shape=(380, 780, 5)):
+    core = ty_colorchecker_v2.TyColorChecker_v2()
+    core.set_shape(shape)
+    core.set_cmfs('CIE 1931 2 Degree Standard Observer')
+    core.set_illuminant('D65')
+    core.set_colorspace('sRGB')
+    core.set_checker(checker)
+    return core
+
+@pytest.fixture
+def disk_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    ty_spectral.RESULTS.enable()
+    yield ty_spectral.RESULTS
+
+def test_switch_checker_with_warm_disk_cache(disk_cache):
+    # 1回目でディスクに載せる
+    for name in ['ISO 17321-1', 'BabelColor Average']:
+        new_core(name).result()
+
+    # ディスクから読んだ xyz の後で checker を変えても古い値を返さない
+    core = new_core('ISO 17321-1')
+    core.result()
+    core.set_checker('BabelColor Average')
+    result = core.result()
+
+    expected = new_core('BabelColor Average').result()
+    assert result['names'] == expected['names']
+    np.testing.assert_allclose(result['xyz'], expected['xyz'])
+    np.testing.assert_allclose(result['rgb'], expected['rgb'])
+
+    # shape を変えた時も
+    core.set_shape((380, 780, 10))
+    expected = new_core('BabelColor Average', (380, 780, 10)).result()
+    np.testing.assert_allclose(core.result()['xyz'], expected['xyz'])
@@ -0,0 +1,34 @@
+import pytest
+
+import ty_service
+
+@pytest.fixture(scope='module')
+def service():
+    return ty_service.Service()
+
+@pytest.mark.parametrize('shape', ['abc', [380, 780], [780, 380, 5], [380, 780, 0],
+                                   [380, 780, float('nan')], [380, True, 5]])
+def test_bad_shape_does_not_break_next_request(service, shape):
+    response = service.handle({'id': 1, 'shape': shape})
+    assert not response['ok']
+    assert 'shape' in response['error']
+
+    # shape を省略した次のリクエストは普通に動く
+    response = service.handle({'id': 2})
+    assert response['ok'], response.get('error')
+    assert service.core.shape() == ty_service.SHAPE
+
+def test_failed_render_restores_shape(service, monkeypatch):
+    service.handle({'id': 1})
+    before = service.core.shape()
+
+    def fail():
+        raise RuntimeError('broken')
+
+    monkeypatch.setattr(service.core, 'result', fail)
+    response = service.handle({'id': 2, 'shape': [400, 700, 10]})
+    assert not response['ok']
+    assert service.core.shape() == before
+
+    monkeypatch.undo()
+    assert service.handle({'id': 3})['ok']
@@ -0,0 +1,72 @@
+import numpy as np
+
+import ty_camera
+import ty_registry
+import ty_spectral
+
+colour = ty_registry.colour
+
+def test_same_name_sensitivities_do_not_share_weights():
+    # 名前が同じでも中身が違う測定データは別の重みで計算する
+    nikon = colour.MSDS_CAMERA_SENSITIVITIES['Nikon 5100 (NPL)']
+    a = nikon.copy()
+    a.name = 'measured'
+    b = nikon.copy()
+    b.name = 'measured'
+    b.values = b.values[:, [2, 1, 0]]
+
+    checker = [colour.characterisation.SDS_COLOURCHECKERS['ISO 17321-1']]
+    illuminant = [colour.SDS_ILLUMINANTS['D65']]
+    shape = (380, 780, 5)
+
+    rgb_a = ty_camera.sweep(checker, illuminant, [a], shape)
+    rgb_b = ty_camera.sweep(checker, illuminant, [b], shape)
+
+    np.testing.assert_allclose(rgb_b[..., 0], rgb_a[..., 2], rtol=1e-6, atol=1e-9)
+    assert not np.allclose(rgb_a, rgb_b)
+
+def test_key_follows_content():
+    cmfs = colour.MSDS_CMFS['CIE 1931 2 Degree Standard Observer']
+    other = colour.MSDS_CMFS['CIE 1964 10 Degree Standard Observer'].copy()
+    other.name = cmfs.name
+
+    assert ty_spectral.sd_key(cmfs) == ty_spectral.sd_key(cmfs.copy())
+    assert ty_spectral.sd_key(cmfs) != ty_spectral.sd_key(other)
+
+def test_in_place_edit_is_not_cached_as_the_old_data(tmp_path, monkeypatch):
+    # 中身をその場で書き換えた光源で古い重みを使わない, ディスクにも間違った値を残さない
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    ty_spectral.RESULTS.enable()
+
+    sds = colour.characterisation.SDS_COLOURCHECKERS['ISO 17321-1']
+    cmfs = colour.MSDS_CMFS['CIE 1931 2 Degree Standard Observer']
+    shape = (380, 780, 5)
+
+    illuminant = colour.SDS_ILLUMINANTS['D65'].copy()
+    d65 = ty_spectral.render(sds, cmfs, illuminant, shape)
+
+    a = colour.SDS_ILLUMINANTS['A'].copy().align(illuminant.shape)
+    illuminant.values = a.values
+    edited = ty_spectral.render(sds, cmfs, illuminant, shape)
+
+    expected = ty_spectral.render(sds, cmfs, illuminant.copy(), shape)
+    ty_spectral.RESULTS.disable()
+    fresh = ty_spectral.render(sds, cmfs, illuminant.copy(), shape)
+    ty_spectral.RESULTS.enable()
+
+    assert not np.allclose(edited, d65)
+    np.testing.assert_allclose(edited, fresh)
+    np.testing.assert_allclose(expected, fresh)
+
+def test_interpolation_matrix_follows_sampling():
+    # 端と点数が同じでも、不等間隔のデータは別の行列で揃える
+    shape = (380, 780, 10)
+    uniform = np.linspace(380, 780, 41)
+    irregular = np.concatenate([np.linspace(380, 500, 30), np.linspace(510, 780, 11)])
+
+    ty_spectral.interpolation_matrix(uniform, shape)
+    result = ty_spectral.interpolation_matrix(irregular, shape)
+
+    values = np.sin(irregular / 40)
+    sd = colour.SpectralDistribution(values, irregular).align(colour.SpectralShape(*shape))
+    np.testing.assert_allclose(result @ values, sd.values, atol=1e-9)
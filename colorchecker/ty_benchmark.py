@@ -0,0 +1,273 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import numpy as np
+
+import ty_colorchecker_v1
+import ty_registry
+import ty_spectral
+
+colour = ty_registry.colour
+
+logger = logging.getLogger(__name__)
+
+SHAPES = [(380, 780, 1), (380, 780, 5), (380, 780, 10), (400, 700, 20)]
+SIZES = [24, 140, 1000]
+CHECKER = 'ISO 17321-1'
+CMFS = 'CIE 1931 2 Degree Standard Observer'
+ILLUMINANT = 'D65'
+COLORSPACE = 'sRGB'
+
+# baseline より何割遅くなったら regression とするか
+THRESHOLD = 0.2
+
+#=================================#
+# Data
+#=================================#
+def checker_sds(size):
+    # CHECKER のパッチを繰り返して size 枚にする
+    sds = colour.characterisation.SDS_COLOURCHECKERS.get(CHECKER)
+    items = list(sds.values())
+
+    result = {}
+    for i in range(size):
+        sd = items[i % len(items)]
+        result[f'{sd.name} {i}'] = sd
+
+    return result
+
+def new_v1(sds, shape):
+    cc = ty_colorchecker_v1.TyColorChecker_v1(ty_colorchecker_v1.logger)
+    cc.set_shape(shape)
+    cc.set_checker(ty_colorchecker_v1.Checker(CHECKER, sds))
+
+    return cc
+
+#=================================#
+# Timer
+#=================================#
+def measure(func, setup=None, repeat=5, cold=False):
+    times = []
+    for _ in range(repeat):
+        if cold:
+            ty_spectral.CACHE.clear()
+
+        state = setup() if setup is not None else None
+
+        start = time.perf_counter()
+        func(state)
+        times.append(time.perf_counter() - start)
+
+    return {
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+        'repeat': repeat,
+    }
+
+#=================================#
+# Benchmarks
+#=================================#
+def benchmarks_v1(shape, size):
+    sds = checker_sds(size)
+
+    def ingest(_):
+        ty_colorchecker_v1.Checker(CHECKER, sds)
+
+    def cmf_setup():
+        return new_v1(sds, shape)
+
+    def cmf(cc):
+        cc.set_cmf(CMFS)
+
+    def render_setup():
+        cc = new_v1(sds, shape)
+        cc.set_cmf(CMFS)
+        cc.set_illuminant(ILLUMINANT)
+        return cc
+
+    def render(cc):
+        cc.render()
+
+    def convert_setup():
+        cc = render_setup()
+        cc.render()
+        return cc
+
+    def convert(cc):
+        cc.convert(COLORSPACE)
+
+    return {
+        'v1.set': (ingest, None),
+        'v1.set_cmf': (cmf, cmf_setup),
+        'v1.render': (render, render_setup),
+        'v1.convert': (convert, convert_setup),
+    }
+
+def benchmarks_v2(shape, size):
+    import ty_colorchecker_v2
+
+    sds = checker_sds(size)
+
+    def new_core():
+        core = ty_colorchecker_v2.TyColorChecker_v2()
+        core.set_shape(shape)
+        return core
+
+    def ingest(core):
+        core._scene.set_checker(ty_colorchecker_v2.Checker(CHECKER, sds))
+
+    def render_setup():
+        core = new_core()
+        ingest(core)
+        core.set_illuminant(ILLUMINANT)
+        core.set_cmfs(CMFS)
+        core.set_colorspace(COLORSPACE)
+        return core
+
+    def render(core):
+        core.render()
+
+    return {
+        'v2.set_checker': (ingest, new_core),
+        'v2.render': (render, render_setup),
+    }
+
+def benchmarks_view():
+    import ty_colorchecker_v2
+    from PySide2 import QtWidgets
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    core = ty_colorchecker_v2.TyColorChecker_v2()
+    view = ty_colorchecker_v2.View(core)
+
+    # 計測中はコンボボックスの変更で描画しない
+    view._pool.waitForDone()
+    view._ready = False
+
+    def setup(_):
+        view.setup()
+
+    return {
+        'v2.View.setup': (setup, None),
+    }
+
+def benchmarks(shapes, sizes, gui=True):
+    result = {}
+
+    for shape in shapes:
+        for size in sizes:
+            key = f'{shape[0]:g}-{shape[1]:g}-{shape[2]:g}/{size}'
+            for name, value in benchmarks_v1(shape, size).items():
+                result[f'{name}[{key}]'] = value
+
+            if gui:
+                for name, value in benchmarks_v2(shape, size).items():
+                    result[f'{name}[{key}]'] = value
+
+    if gui:
+        result.update(benchmarks_view())
+
+    return result
+
+#=================================#
+# Run
+#=================================#
+def meta():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'colour': colour.__version__,
+    }
+
+def run(shapes=SHAPES, sizes=SIZES, repeat=5, cold=False, gui=True, pattern=None,
+        disk_cache=False):
+    for name in ['ty_colorchecker_v1', 'ty_colorchecker_v2', 'ty_checker']:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    # 計算そのものを測るので、デフォルトではディスクのキャッシュを使わない
+    if not disk_cache:
+        ty_spectral.RESULTS.disable()
+
+    if gui:
+        try:
+            import ty_colorchecker_v2
+        except ImportError as e:
+            logger.warning(f'Skip GUI benchmarks: {e}')
+            gui = False
+
+    results = {}
+    for name, (func, setup) in benchmarks(shapes, sizes, gui).items():
+        if pattern and not pattern in name:
+            continue
+
+        results[name] = measure(func, setup, repeat, cold)
+        logger.info(f'{name:<40} {results[name]["median"] * 1000:10.3f} ms')
+
+    return {'meta': meta(), 'results': results}
+
+def compare(results, baseline, threshold=THRESHOLD):
+    # median で比較して threshold 以上遅くなったものを返す
+    regressions = {}
+
+    for name, value in results['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+
+        ratio = value['median'] / base['median'] if base['median'] > 0 else 1.0
+        if ratio > 1.0 + threshold:
+            regressions[name] = {
+                'baseline': base['median'],
+                'median': value['median'],
+                'ratio': ratio,
+            }
+
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Colour checker pipeline benchmarks.')
+    parser.add_argument('-o', '--output', help='write results (json)')
+    parser.add_argument('-b', '--baseline', help='compare with baseline results (json)')
+    parser.add_argument('-t', '--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('-k', '--pattern', help='run benchmarks whose name contains this')
+    parser.add_argument('--cold', action='store_true', help='clear spectral cache every repeat')
+    parser.add_argument('--no-gui', action='store_true', help='skip PySide2 benchmarks')
+    parser.add_argument('--disk-cache', action='store_true', help='use the result cache on disk')
+    args = parser.parse_args(argv)
+
+    results = run(
+        repeat=args.repeat, cold=args.cold, gui=not args.no_gui, pattern=args.pattern,
+        disk_cache=args.disk_cache)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+        regressions = compare(results, baseline, args.threshold)
+        for name, value in regressions.items():
+            logger.warning(
+                f'{name}: {value["baseline"] * 1000:.3f} ms -> '
+                f'{value["median"] * 1000:.3f} ms (x{value["ratio"]:.2f})')
+
+        if regressions:
+            return 1
+
+    return 0
+
+if __name__ == '__main__':
+    logging.basicConfig(level = logging.INFO)
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+    sys.exit(main())
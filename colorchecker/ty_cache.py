@@ -0,0 +1,276 @@
+import collections
+import hashlib
+import logging
+import os
+import numpy as np
+
+import ty_registry
+
+logger = logging.getLogger(__name__)
+
+#=================================#
+# Memory
+#=================================#
+class ArrayCache:
+    # key -> np.ndarray
+    # max_bytes を超えたら古いものから捨てる (LRU)
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self._data = collections.OrderedDict()
+        self._max_bytes = max_bytes
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    #=================================#
+    # Set / Get
+    #=================================#
+    def set_max_bytes(self, max_bytes):
+        self._max_bytes = max_bytes
+        self.evict()
+
+    def max_bytes(self):
+        return self._max_bytes
+
+    def nbytes(self):
+        return self._bytes
+
+    def hits(self):
+        return self._hits
+
+    def misses(self):
+        return self._misses
+
+    def stats(self):
+        return {
+            'entries': len(self._data),
+            'bytes': self._bytes,
+            'max_bytes': self._max_bytes,
+            'hits': self._hits,
+            'misses': self._misses,
+        }
+
+    #=================================#
+    # Methods
+    #=================================#
+    def get(self, key, func):
+        if key in self._data:
+            self._hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+
+        self._misses += 1
+        value = func()
+        value.setflags(write=False)
+
+        self._data[key] = value
+        self._bytes += value.nbytes
+        self.evict()
+
+        return value
+
+    def evict(self):
+        while self._bytes > self._max_bytes and self._data:
+            _, value = self._data.popitem(last=False)
+            self._bytes -= value.nbytes
+
+    def clear(self):
+        self._data.clear()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+#=================================#
+# Disk
+#=================================#
+def digest(parts):
+    # 中身から key を作る
+    # ndarray / SpectralDistribution (wavelengths, values) / dict / tuple / str / 数値
+    h = hashlib.blake2b(digest_size=20)
+
+    def update(value):
+        if isinstance(value, np.ndarray):
+            h.update(f'ndarray{value.dtype.str}{value.shape}'.encode())
+            h.update(np.ascontiguousarray(value).tobytes())
+        elif hasattr(value, 'wavelengths') and hasattr(value, 'values'):
+            h.update(b'sd')
+            update(np.asarray(value.wavelengths, dtype=np.float64))
+            update(np.asarray(value.values, dtype=np.float64))
+        elif isinstance(value, dict):
+            h.update(f'dict{len(value)}'.encode())
+            for k, v in value.items():
+                update(k)
+                update(v)
+        elif isinstance(value, (list, tuple)):
+            h.update(f'seq{len(value)}'.encode())
+            for v in value:
+                update(v)
+        else:
+            h.update(f'{type(value).__name__}:{value!r};'.encode())
+
+    update(parts)
+    return h.hexdigest()
+
+def remove(path):
+    # Windows では memory map 中の .npy は消せない (PermissionError), その時は残す
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.debug(f'Failed to remove "{path}": {e}')
+        return False
+
+    return True
+
+class DiskCache:
+    # 内容のハッシュ -> .npy (memory map で読む)
+    # max_bytes を超えたら最後に使った時刻 (mtime) が古いものから捨てる (LRU)
+    # TY_COLORCHECKER_CACHE=0 で無効
+    def __init__(self, name, max_bytes=256 * 1024 * 1024, enabled=None):
+        if enabled is None:
+            enabled = os.environ.get('TY_COLORCHECKER_CACHE', '1') not in ('', '0')
+
+        self._name = name
+        self._max_bytes = max_bytes
+        self._enabled = enabled
+        self._bytes = None
+        self._hits = 0
+        self._misses = 0
+
+    #=================================#
+    # Set / Get
+    #=================================#
+    def directory(self):
+        return os.path.join(ty_registry.cache_dir(), self._name)
+
+    def path(self, key):
+        return os.path.join(self.directory(), f'{key}.npy')
+
+    def enable(self):
+        self._enabled = True
+
+    def disable(self):
+        self._enabled = False
+
+    def is_enabled(self):
+        return self._enabled
+
+    def set_max_bytes(self, max_bytes):
+        self._max_bytes = max_bytes
+        self.evict()
+
+    def max_bytes(self):
+        return self._max_bytes
+
+    def nbytes(self):
+        if self._bytes is None:
+            self._bytes = sum(size for _, size, _ in self.entries())
+
+        return self._bytes
+
+    def stats(self):
+        return {
+            'directory': self.directory(),
+            'bytes': self.nbytes(),
+            'max_bytes': self._max_bytes,
+            'hits': self._hits,
+            'misses': self._misses,
+        }
+
+    #=================================#
+    # Methods
+    #=================================#
+    def get(self, parts, func):
+        if not self._enabled:
+            return func()
+
+        path = self.path(digest(parts))
+        value = self.load(path)
+        if value is not None:
+            self._hits += 1
+            return value
+
+        self._misses += 1
+        value = np.asarray(func())
+        value.setflags(write=False)
+        self.save(path, value)
+
+        return value
+
+    def load(self, path):
+        try:
+            value = np.load(path, mmap_mode='r', allow_pickle=False)
+            # 使った時刻を更新 (LRU)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f'Failed to read "{path}": {e}')
+            return None
+
+        return value
+
+    def save(self, path, value):
+        tmp = f'{path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, 'wb') as f:
+                np.save(f, value, allow_pickle=False)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f'Failed to write "{path}": {e}')
+            remove(tmp)
+            return
+
+        self._bytes = self.nbytes() + os.path.getsize(path)
+        if self._bytes > self._max_bytes:
+            self.evict()
+
+    def entries(self):
+        # [(path, size, mtime), ...]
+        result = []
+        try:
+            names = os.listdir(self.directory())
+        except FileNotFoundError:
+            return result
+
+        for name in names:
+            if not name.endswith('.npy'):
+                continue
+
+            path = os.path.join(self.directory(), name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            result.append((path, stat.st_size, stat.st_mtime))
+
+        return result
+
+    def evict(self):
+        # 別プロセスも書くので、ディレクトリを見直してから捨てる
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+
+        for path, size, _ in entries:
+            if total <= self._max_bytes:
+                break
+            if remove(path):
+                total -= size
+
+        self._bytes = total
+
+    def clear(self):
+        # 消せなかったもの (memory map 中) が残るので大きさは数え直す
+        for path, _, _ in self.entries():
+            remove(path)
+
+        self._bytes = None
+        self._hits = 0
+        self._misses = 0
@@ -0,0 +1,113 @@
+import logging
+import numpy as np
+
+import ty_colorimetry
+import ty_registry
+import ty_spectral
+from ty_stats import STATS
+
+colour = ty_registry.colour
+
+logger = logging.getLogger(__name__)
+
+# カメラ感度でのレンダリングと IDT (camera RGB -> XYZ / ACES) の 3x3 行列
+#
+# camera = MSDS_CAMERA_SENSITIVITIES の名前か、測定した MultiSpectralDistributions
+DEFAULT_CMFS = 'CIE 1931 2 Degree Standard Observer'
+
+#=================================#
+# Camera
+#=================================#
+def camera(value):
+    if isinstance(value, str):
+        return colour.MSDS_CAMERA_SENSITIVITIES[value]
+
+    return value
+
+def cameras(values):
+    return [camera(value) for value in values]
+
+#=================================#
+# Render
+#=================================#
+def sweep(checkers, illuminants, sensitivities, shape):
+    # -> (checker, illuminant, camera, patch, 3)
+    # CMFs と同じく完全拡散反射面の G = 1.0
+    return ty_spectral.sweep(checkers, illuminants, cameras(sensitivities), shape)
+
+def sweep_whites(illuminants, sensitivities, shape):
+    # -> (illuminant, camera, 3) 完全拡散反射面の RGB
+    return ty_spectral.sweep_whitepoints(illuminants, cameras(sensitivities), shape)
+
+def white_balance(rgb, whites):
+    # rgb (checker, illuminant, camera, patch, 3), whites (illuminant, camera, 3)
+    return rgb / whites[np.newaxis, :, :, np.newaxis, :]
+
+def targets(checkers, illuminants, shape, cmfs=DEFAULT_CMFS, colorspace=None, adaptation='CAT02'):
+    # -> (checker, illuminant, patch, 3)
+    # colorspace = None なら XYZ, 指定したら光源の白色点から色順応して RGB
+    cmfs = colour.MSDS_CMFS.get(cmfs) if isinstance(cmfs, str) else cmfs
+
+    xyz = ty_spectral.sweep(checkers, illuminants, [cmfs], shape)
+    if colorspace is None:
+        return xyz[:, :, 0]
+
+    whitepoints = ty_spectral.sweep_whitepoints(illuminants, [cmfs], shape)
+    rgb = ty_colorimetry.sweep_to_RGB(xyz, whitepoints, [colorspace], adaptation)
+
+    return rgb[:, :, 0, 0]
+
+#=================================#
+# Fit
+#=================================#
+def fit(rgb, target):
+    # rgb (..., N, 3), target (..., N, 3) -> (..., 3, 3)
+    # target ≈ M @ rgb の最小二乗を正規方程式でまとめて解く
+    # NaN (パッチ数の違うチェッカーの埋め草) の行は使わない
+    rgb, target = np.broadcast_arrays(
+        np.asarray(rgb, dtype=np.float64), np.asarray(target, dtype=np.float64))
+
+    with STATS.stage('fit'):
+        valid = np.all(np.isfinite(rgb) & np.isfinite(target), axis=-1)[..., np.newaxis]
+        a = np.where(valid, rgb, 0.0)
+        b = np.where(valid, target, 0.0)
+
+        ata = np.einsum('...ni,...nj->...ij', a, a)
+        atb = np.einsum('...ni,...nj->...ij', a, b)
+
+        return np.swapaxes(np.linalg.solve(ata, atb), -1, -2)
+
+def apply(matrix, rgb):
+    # matrix (..., 3, 3), rgb (..., N, 3) -> (..., N, 3)
+    return np.einsum('...ij,...nj->...ni', matrix, rgb)
+
+def residual(matrix, rgb, target):
+    # パッチごとの誤差の RMS -> (...)
+    error = apply(matrix, rgb) - target
+    return np.sqrt(np.nanmean(np.sum(error ** 2, axis=-1), axis=-1))
+
+def idt(checkers, illuminants, sensitivities, shape, cmfs=DEFAULT_CMFS,
+        colorspace=None, adaptation='CAT02', balance=True):
+    # カメラ x 光源ごとの 3x3 を一度に求める
+    # 複数のチェッカーはパッチをまとめて1つの行列にする
+    # balance = True ならホワイトバランス後の RGB から求める
+    rgb = sweep(checkers, illuminants, sensitivities, shape)
+    if balance:
+        rgb = white_balance(rgb, sweep_whites(illuminants, sensitivities, shape))
+
+    target = targets(checkers, illuminants, shape, cmfs, colorspace, adaptation)
+
+    # (illuminant, camera, checker * patch, 3)
+    c, i, k, n, _ = rgb.shape
+    rgb = np.reshape(np.transpose(rgb, (1, 2, 0, 3, 4)), (i, k, c * n, 3))
+    target = np.reshape(np.transpose(target, (1, 0, 2, 3)), (i, 1, c * n, 3))
+
+    matrix = fit(rgb, target)
+    logger.debug(f'fit {i} x {k} matrices')
+
+    return {
+        'matrix': matrix,
+        'rgb': rgb,
+        'target': np.broadcast_to(target, rgb.shape),
+        'residual': residual(matrix, rgb, target),
+    }
@@ -0,0 +1,184 @@
+import logging
+import numpy as np
+from pprint import pprint
+
+import ty_registry
+import ty_spectral
+from ty_stats import STATS
+
+colour = ty_registry.colour
+
+logger = logging.getLogger(__name__)
+
+#=================================#
+# Patch
+#=================================#
+class Patch:
+    # Checker の配列の1行を指すだけのビュー
+    __slots__ = ('_checker', '_index')
+
+    def __init__(self, checker, index):
+        self._checker = checker
+        self._index = index
+
+    def __repr__(self):
+        return f'Patch({self.name()!r}, xyz={self.xyz()}, rgb={self.rgb()})'
+
+    #=================================#
+    # Set / Get
+    #=================================#
+    def name(self):
+        return self._checker.names()[self._index]
+
+    def index(self):
+        return self._index
+
+    def spectral_distribution(self):
+        return self._checker.sds()[self.name()]
+
+    # xyz
+    def set_xyz(self, xyz):
+        xyzs = np.array(self._checker.xyzs())
+        xyzs[self._index] = xyz
+        self._checker.set_xyzs(xyzs)
+
+    def xyz(self):
+        return self._checker.xyzs()[self._index]
+
+    # rgb
+    def set_rgb(self, rgb):
+        rgbs = np.array(self._checker.rgbs())
+        rgbs[self._index] = rgb
+        self._checker.set_rgbs(rgbs)
+
+    def rgb(self):
+        return self._checker.rgbs()[self._index]
+
+    def srgb(self):
+        return colour.XYZ_to_sRGB(self.xyz())
+
+    def xyY(self):
+        return colour.XYZ_to_xyY(self.xyz())
+
+#=================================#
+# Checker
+#=================================#
+def snapshot(values, shape):
+    return np.array(np.broadcast_to(values, shape), dtype=np.float64)
+
+class Checker:
+    # パッチごとのオブジェクトを持たず、配列でまとめて持つ
+    # _names  : (N, ) tuple
+    # _values : { shape: (N, λ) }
+    # _xyz    : (N, 3)
+    # _rgb    : (N, 3)
+    # _dif    : (N, )
+    __slots__ = ('_name', '_names', '_sds', '_values', '_xyz', '_rgb', '_dif')
+
+    def __init__(self, name, sds):
+        self._name = None
+        self._names = ()
+        self._sds = {}
+        self._values = {}
+        self._xyz = np.zeros((0, 3))
+        self._rgb = np.zeros((0, 3))
+        self._dif = np.zeros(0)
+
+        self.set_name(name)
+        self.set_sds(sds)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self._name!r}, {self.count()} patches)'
+
+    def __len__(self):
+        return self.count()
+
+    #=================================#
+    # Set / Get
+    #=================================#
+    # Name
+    def set_name(self, name):
+        self._name = name
+
+    def name(self):
+        return self._name
+
+    # Pathces
+    def set_sds(self, sds):
+        with STATS.stage('ingest'):
+            self._names = tuple(sds.keys())
+            self._sds = dict(sds)
+            self._values = {}
+
+            n = len(self._names)
+            self._xyz = np.full((n, 3), np.nan)
+            self._rgb = np.full((n, 3), np.nan)
+            self._dif = np.full(n, np.nan)
+
+        logger.debug(f'{n} patches')
+
+    def sds(self):
+        return self._sds
+
+    def names(self):
+        return self._names
+
+    def count(self):
+        return len(self._names)
+
+    def index(self, name):
+        return self._names.index(name)
+
+    def patch(self, name):
+        return Patch(self, self.index(name))
+
+    def patches(self):
+        return { name: Patch(self, i) for i, name in enumerate(self._names) }
+
+    # (N, λ)
+    def values(self, shape):
+        key = tuple(shape)
+        if not key in self._values:
+            self._values[key] = ty_spectral.align_sds(self._sds, shape)
+
+        return self._values[key]
+
+    # (N, 3)
+    # 書き込まずに新しい配列にする (前に xyz() / rgb() で返した行はそのまま残る)
+    def set_xyzs(self, xyzs):
+        self._xyz = snapshot(xyzs, self._xyz.shape)
+
+    def xyzs(self):
+        return self._xyz
+
+    def set_rgbs(self, rgbs):
+        self._rgb = snapshot(rgbs, self._rgb.shape)
+
+    def rgbs(self):
+        return self._rgb
+
+    # (N, )
+    def set_difs(self, difs):
+        self._dif = snapshot(difs, self._dif.shape)
+
+    def difs(self):
+        return self._dif
+
+    # { name: (3, ) } 配列の行をそのまま返す
+    def xyz(self):
+        return dict(zip(self._names, self._xyz))
+
+    def rgb(self):
+        return dict(zip(self._names, self._rgb))
+
+    def srgb(self):
+        return dict(zip(self._names, colour.XYZ_to_sRGB(self._xyz)))
+
+    def xyY(self):
+        return dict(zip(self._names, colour.XYZ_to_xyY(self._xyz)))
+
+    #=================================#
+    # Methods
+    #=================================#
+    def show(self):
+        pprint(self.patches())
@@ -1,83 +1,36 @@
-import dataclasses
-import colour
 import logging
 import numpy as np
-import matplotlib.pyplot as plt
 from pprint import pprint
 
-logger = logging.getLogger(__name__)
-
-@dataclasses.dataclass
-class Patch:
-    _name: str
-    _spectral_distribution: list
-    _xyz: list = dataclasses.field(default_factory=list)
-    _rgb: list = dataclasses.field(default_factory=list)
-
-    #=================================#
-    # Set / Get
-    #=================================#
-    def name(self):
-        return self._name
-
-    # xyz
-    def set_xyz(self, xyz):
-        self._xyz = xyz
-
-    def xyz(self):
-        return self._xyz
-
-    # rgb
-    def set_rgb(self, rgb):
-        self._rgb = rgb
-
-    def rgb(self):
-        return self._rgb
-
-    def srgb(self):
-        return colour.XYZ_to_sRGB(self.xyz())
-
-    def xyY(self):
-        return colour.XYZ_to_xyY(self.xyz())
-    #=================================#
-    # Method
-    #=================================#
-    def calc_xyz(self, cmfs, min_sd, max_sd, steps):
-        result = colour.sd_to_XYZ(
-            self._spectral_distribution,
-            cmfs,
-            method='Integration',
-            shape=colour.SpectralShape(min_sd, max_sd, steps)
-        )
-
-        return result/100.0
+import ty_camera
+import ty_checker
+import ty_colorimetry
+import ty_image
+import ty_lut
+import ty_registry
+import ty_sequence
+import ty_spectral
+import ty_upsample
+from ty_stats import STATS
 
-    def render(self, cmfs, illuminant, shape):
-        result = colour.sd_to_XYZ(
-            self._spectral_distribution,
-            cmfs,
-            illuminant,
-            shape=colour.SpectralShape(shape[0], shape[1], shape[2])
-        )
+# colour は最初に使う時に import する
+colour = ty_registry.colour
 
-        return result/100.0
+logger = logging.getLogger(__name__)
 
-@dataclasses.dataclass
-class Checker:
-    _name: str = dataclasses.field(init=False)
-    _patches: dict = dataclasses.field(init=False)
-    _cmfs: list = None
-    _illuminant: list = None
-    _illuminant_name: str = None
+class Checker(ty_checker.Checker):
+    __slots__ = ('_cmfs', '_illuminant', '_illuminant_name', '_whitepoint')
 
     def __init__(self, name, sds):
         logger.info('Init Chekcer data')
         logger.info(f'name = {name}')
 
-        self._patches = {}
+        self._cmfs = None
+        self._illuminant = None
+        self._illuminant_name = None
+        self._whitepoint = None
 
-        self.set_name(name)
-        self.set_sds(sds)
+        super().__init__(name, sds)
 
     #=================================#
     # Set / Get
@@ -89,8 +42,11 @@ class Checker:
         il_name = self.illuminant_name()
         patches = self.xyY()
 
-        # il = colour.CCS_ILLUMINANTS['CIE 1931 2 Degree Standard Observer'][il_name]           
-        il = colour.CCS_ILLUMINANTS['CIE 1931 2 Degree Standard Observer']['D65']           
+        # レンダリングした光源の白色点 (未レンダリングなら D65)
+        if self._whitepoint is None:
+            il = colour.CCS_ILLUMINANTS['CIE 1931 2 Degree Standard Observer']['D65']
+        else:
+            il = colour.XYZ_to_xy(self._whitepoint)
 
         result = colour.characterisation.ColourChecker(
             name,
@@ -100,13 +56,6 @@ class Checker:
 
         return result
 
-    # Name
-    def set_name(self, name):
-        self._name = name
-
-    def name(self):
-        return self._name
-
     def full_name(self):
         name = self.name()
         ilm_name = self.illuminant_name()
@@ -114,19 +63,6 @@ class Checker:
         result = f'ColorChecker24 - {name}({ilm_name})'
         return result
 
-    # Pathces
-    def set_sds(self, sds):
-        for name in sds:
-            logger.info(name)
-            sd = sds.get(name)
-            patch = Patch(name, sd)
-
-            self.set_patch(name, patch)
-
-    # patch
-    def set_patch(self, name, path):
-        self._patches[name] = path
-
     # cmf
     def set_cmfs(self, cmfs):
         self._cmfs = cmfs
@@ -148,61 +84,44 @@ class Checker:
     def illuminant_name(self):
         return self._illuminant_name
 
-    # xyz
-    def xyz(self):
-        result = { name: self._patches[name].xyz() for name in self._patches }
-        return result
-
-    def rgb(self):
-        result = { name: np.array(self._patches[name].rgb()) for name in self._patches }
-        return result
-
-    def srgb(self):
-        result = { name: np.array(self._patches[name].srgb()) for name in self._patches }
-        return result
-
-    def xyY(self):
-        result = { name: np.array(self._patches[name].xyY()) for name in self._patches }
-        return result
+    def whitepoint(self):
+        return self._whitepoint
 
     #=================================#
     # Methods
     #=================================#
     def update_xyz(self, min_sd, max_sd, steps):
+        shape = (min_sd, max_sd, steps)
         cmfs = self.cmfs()
 
-        for name in self._patches:
-            patch = self._patches.get(name)
-
-            xyz = patch.calc_xyz(
-                cmfs, min_sd, max_sd, steps)
-
-            patch.set_xyz(xyz)
+        self.set_xyzs(ty_spectral.render(
+            self.sds(), cmfs, None, shape, lambda: self.values(shape)))
+        self._whitepoint = ty_spectral.whitepoint(cmfs, None, shape)
 
     def render(self, shape):
         cmfs = self.cmfs()
         ilm = self.illuminant()
 
-        for name in self._patches:
-            patch = self._patches.get(name)
-
-            xyz = patch.render( cmfs, ilm , shape)
-
-            patch.set_xyz(xyz)
+        self.set_xyzs(ty_spectral.render(
+            self.sds(), cmfs, ilm, shape, lambda: self.values(shape)))
+        self._whitepoint = ty_spectral.whitepoint(cmfs, ilm, shape)
 
-    def convert(self, name):
-        m = colour.RGB_COLOURSPACES[name].matrix_XYZ_to_RGB
+    # method = 'Bradford' / 'CAT02' / 'CAT16' で光源の白色点から色順応
+    def convert(self, name, method=None):
+        rgbs = ty_colorimetry.XYZ_to_RGB(self.xyzs(), name, self._whitepoint, method)
+        self.set_rgbs(rgbs)
 
-        for name in self._patches:
-            patch = self._patches.get(name)
+    def evaluate(self, names, xyz, whitepoint, method='CIE 2000', adaptation=None):
+        index = ty_colorimetry.match(self.names(), names)
+        if index is None:
+            logger.warning('Patches do not match.')
+            return None
 
-            xyz = patch.xyz()
+        difs = ty_colorimetry.delta_E(
+            self.xyzs(), self._whitepoint, xyz[index], whitepoint, method, adaptation)
+        self.set_difs(difs)
 
-            rgb = m@xyz
-            patch.set_rgb(rgb)
-
-    def show(self):
-        pprint(self._patches)
+        return ty_colorimetry.summary(difs, self.names())
 
 class TyColorChecker_v1:
     script_updated = 'JAN 20 2021'
@@ -222,10 +141,15 @@ class TyColorChecker_v1:
 
         self._checker = None
         self._shape = None
+        self._tolerance = None
 
     def init_logger(self):
         logger.propagate = False
 
+        # インスタンスを作るたびに handler を増やさない
+        if logger.handlers:
+            return logger
+
         stream_handler = logging.StreamHandler()
         stream_handler.setLevel(logging.DEBUG)
         stream_handler.setFormatter(logging.Formatter(
@@ -249,6 +173,25 @@ class TyColorChecker_v1:
             checker = Checker(name, sds)
             self.set_checker(checker)
 
+    # スペクトルデータが無い CCS_COLOURCHECKERS を SD にして使う
+    def set_upsampled(self, name, method='Jakob 2019'):
+        logger.info(f'Checker = {name} / {method}')
+        if not name in self.reference_names():
+            logger.warning(f'"{name}" is not found.')
+            return
+
+        sds = ty_upsample.reference_sds(name, method)
+        if sds is not None:
+            self.set_checker(Checker(name, sds))
+
+    # メーカーの sRGB 値 (0 - 1) から
+    def set_srgb(self, name, names, rgb, method='Jakob 2019'):
+        logger.info(f'Checker = {name} / {method}')
+
+        sds = ty_upsample.srgb_sds(names, rgb, method)
+        if sds is not None:
+            self.set_checker(Checker(name, sds))
+
     def get(self):
         return self._checker
 
@@ -305,28 +248,203 @@ class TyColorChecker_v1:
     def shape(self):
         return self._shape
 
+    # tolerance (ΔE) を指定したら render() の波長間隔を自動で決める
+    # shape の start / end はそのまま使う, None で固定に戻す
+    def set_tolerance(self, tolerance):
+        self._tolerance = tolerance
+
+    def tolerance(self):
+        return self._tolerance
+
     # スペクトルデータを持つチェッカー名リスト取得
     def chekcer_names(self):
-        return sorted(colour.characterisation.SDS_COLOURCHECKERS.keys())
+        return ty_registry.names('checkers')
     
     def cmf_names(self):
-        return sorted(colour.MSDS_CMFS.keys())
+        return ty_registry.names('cmfs')
 
     def illuminant_names(self):
-        return sorted(colour.SDS_ILLUMINANTS.keys())
+        return ty_registry.names('illuminants')
 
     def colorspace_names(self):
-        return sorted(colour.RGB_COLOURSPACES.keys())
+        return ty_registry.names('colorspaces')
+
+    def reference_names(self):
+        return ty_registry.names('references')
+
+    def camera_names(self):
+        return ty_registry.names('cameras')
 
     #=================================#
     # Methods
     #=================================#
     def render(self):
         shape = self.shape()
+
+        if self._tolerance is not None:
+            checker = self._checker
+            shape, error = ty_spectral.auto_shape(
+                checker.sds(), checker.cmfs(), checker.illuminant(), self._tolerance,
+                shape[0], shape[1])
+            logger.info(f'Auto Shape = {shape} / ΔE max {error:.4f}')
+
         self._checker.render(shape)
 
-    def convert(self, name):
-        self._checker.convert(name)
+    def convert(self, name, method=None):
+        self._checker.convert(name, method)
+
+    # reference = CCS_COLOURCHECKERS の名前か、レンダリング済みの TyColorChecker_v1
+    def evaluate(self, reference='ColorChecker24 - After November 2014',
+                 method='CIE 2000', adaptation=None):
+        logger.info('> Evaluate')
+
+        if isinstance(reference, TyColorChecker_v1):
+            checker = reference.get()
+            names, xyz, whitepoint = checker.names(), checker.xyzs(), checker.whitepoint()
+        elif not reference in self.reference_names():
+            logger.warning(f'"{reference}" is not found.')
+            return None
+        else:
+            names, xyz, whitepoint = ty_colorimetry.reference(reference)
+
+        logger.info(f'{reference} / {method}')
+        return self._checker.evaluate(names, xyz, whitepoint, method, adaptation)
+
+    # 撮影したチェッカー画像 (linear RGB) と render() の結果を比較
+    # quad = 画像上のチェッカーの四隅 (左上, 右上, 右下, 左下) の (x, y)
+    # raw は image_shape / dtype / offset を指定, 露出は Y の最小二乗で合わせる
+    def evaluate_image(self, path, colorspace, rows, cols, quad, size=0.5,
+                       method='CIE 2000', adaptation=None,
+                       image_shape=None, dtype=np.float32, offset=0):
+        logger.info('> Evaluate Image')
+        logger.info(f'{path} / {colorspace}')
+
+        if not colorspace in self.colorspace_names():
+            logger.warning(f'"{colorspace}" is not found.')
+            return None
+
+        checker = self._checker
+        if rows * cols != checker.count():
+            logger.warning(f'{rows} x {cols} does not match {checker.count()} patches.')
+            return None
+
+        rgb = ty_image.read_checker(path, rows, cols, quad, size, image_shape, dtype, offset)
+        if rgb is None:
+            return None
+
+        xyz = ty_colorimetry.RGB_to_XYZ(rgb, colorspace)
+        xyz *= ty_colorimetry.exposure(xyz, checker.xyzs())
+
+        whitepoint = ty_colorimetry.colorspace_whitepoint(colorspace)
+        return checker.evaluate(checker.names(), xyz, whitepoint, method, adaptation)
+
+    # evaluate_image() をディレクトリの連番に, 1フレームずつ結果を返す generator
+    def analyse_sequence(self, directory, colorspace, rows, cols, quad, size=0.5,
+                         method='CIE 2000', adaptation=None, depth=4, workers=2,
+                         image_shape=None, dtype=np.float32, offset=0):
+        logger.info('> Analyse Sequence')
+        logger.info(f'{directory} / {colorspace}')
+
+        if not colorspace in self.colorspace_names():
+            logger.warning(f'"{colorspace}" is not found.')
+            return iter(())
+
+        checker = self._checker
+        if rows * cols != checker.count():
+            logger.warning(f'{rows} x {cols} does not match {checker.count()} patches.')
+            return iter(())
+
+        return ty_sequence.analyse(
+            ty_sequence.frames(directory), checker.xyzs().copy(), checker.whitepoint(),
+            colorspace, rows, cols, quad, size, method, adaptation, checker.names(),
+            depth, workers, image_shape, dtype, offset)
+
+    # convert() した self の RGB を target (TyColorChecker_v1) の RGB に合わせる 3x3 を
+    # colorspace の cctf と一緒に 3D LUT (.cube / .spi3d) に焼く
+    def bake_lut(self, path, target, size=33, colorspace=None, encode=True, title=None):
+        logger.info('> Bake LUT')
+        logger.info(f'{path} / {size}')
+
+        if colorspace is not None and not colorspace in self.colorspace_names():
+            logger.warning(f'"{colorspace}" is not found.')
+            return None
+
+        source, dest = self._checker.rgbs(), target.get().rgbs()
+        if source.shape != dest.shape or np.isnan(source).all() or np.isnan(dest).all():
+            logger.warning('RGB is not converted.')
+            return None
+
+        matrix = ty_lut.correction_matrix(source, dest)
+        func = ty_lut.transform(matrix, colorspace, encode)
+
+        return ty_lut.bake(path, func, size, title=title)
+
+    def dif(self):
+        return dict(zip(self._checker.names(), self._checker.difs()))
+
+    # checker x illuminant x cmfs -> (checker, illuminant, observer, patch, 3)
+    def sweep(self, checkers, illuminants, cmfs, shape=None):
+        logger.info('> Sweep')
+        logger.info(f'{len(checkers)} x {len(illuminants)} x {len(cmfs)}')
+
+        if shape is None:
+            shape = self.shape()
+
+        names = [
+            (checkers, self.chekcer_names()),
+            (illuminants, self.illuminant_names()),
+            (cmfs, self.cmf_names()),
+        ]
+        for items, keys in names:
+            for name in items:
+                if not name in keys:
+                    logger.warning(f'"{name}" is not found.')
+                    return None
+
+        result = ty_spectral.sweep(
+            [colour.characterisation.SDS_COLOURCHECKERS.get(name) for name in checkers],
+            [colour.SDS_ILLUMINANTS.get(name) for name in illuminants],
+            [colour.MSDS_CMFS.get(name) for name in cmfs],
+            shape
+        )
+
+        return result
+
+    # cameras = MSDS_CAMERA_SENSITIVITIES の名前か測定した MultiSpectralDistributions
+    # colorspace = None なら camera RGB -> XYZ, 'ACES2065-1' などで RGB
+    def fit_idt(self, checkers, illuminants, cameras, colorspace=None,
+                adaptation='CAT02', shape=None):
+        logger.info('> Fit IDT')
+        logger.info(f'{len(checkers)} x {len(illuminants)} x {len(cameras)}')
+
+        if shape is None:
+            shape = self.shape()
+
+        names = [
+            (checkers, self.chekcer_names()),
+            (illuminants, self.illuminant_names()),
+            ([name for name in cameras if isinstance(name, str)], self.camera_names()),
+        ]
+        if colorspace is not None:
+            names.append(([colorspace], self.colorspace_names()))
+
+        for items, keys in names:
+            for name in items:
+                if not name in keys:
+                    logger.warning(f'"{name}" is not found.')
+                    return None
+
+        result = ty_camera.idt(
+            [colour.characterisation.SDS_COLOURCHECKERS.get(name) for name in checkers],
+            [colour.SDS_ILLUMINANTS.get(name) for name in illuminants],
+            cameras,
+            shape,
+            colorspace=colorspace,
+            adaptation=adaptation,
+        )
+
+        return result
+
     #=================================#
     # Show
     #=================================#
@@ -359,6 +477,25 @@ class TyColorChecker_v1:
         logger.info('> Show RGB')
         result = self.rgb()
         pprint(result)
+
+    def show_dif(self):
+        logger.info('> Show Delta E')
+        result = self.dif()
+        pprint(result)
+
+    def show_stats(self):
+        logger.info('> Show Stats')
+        result = STATS.stats()
+        pprint(result)
+
+    def show_cache(self):
+        logger.info('> Show Spectral Cache')
+        result = ty_spectral.CACHE.stats()
+        pprint(result)
+
+        logger.info('> Show Result Cache')
+        result = ty_spectral.RESULTS.stats()
+        pprint(result)
     #=================================#
     # Plot
     #=================================#
@@ -399,6 +536,8 @@ def main():
     cc.set_shape((380, 780, 5))
     
     cc.show_checkers()
+    logger.info(f'> Startup = {ty_registry.startup_time():.3f} sec')
+
     cc.set('ISO 17321-1')
     # cc.show()
 
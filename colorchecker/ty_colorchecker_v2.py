@@ -1,15 +1,32 @@
-import colour
 import dataclasses
 import logging
-import matplotlib.pyplot as plt
+import math
 import numpy as np
 from pprint import pprint
 import sys
 
 from PySide2 import QtCore, QtGui, QtWidgets
 
+import ty_cache
+import ty_checker
+import ty_colorimetry
+import ty_registry
+import ty_spectral
+from ty_stats import STATS
+
+# colour / matplotlib は最初に使う時に import する
+colour = ty_registry.colour
+
 logger = logging.getLogger(__name__)
 
+# プレビューの波長間隔と、コンボボックスの変更をまとめる時間 (ms)
+PREVIEW_SHAPE = (380, 780, 20)
+DEBOUNCE = 150
+
+# アトラスの1枚の大きさと、下の名前を書く帯の高さ
+TILE_SIZE = (240, 160)
+LABEL_HEIGHT = 18
+
 @dataclasses.dataclass
 class Material:
     _name: str
@@ -17,70 +34,105 @@ class Material:
     _xyz: list = dataclasses.field(default_factory=list)
     _dif: list = dataclasses.field(default_factory=list)
 
-@dataclasses.dataclass
-class Checker:
-    _name: str = dataclasses.field(init=False)
-    _patches: dict = dataclasses.field(init=False)
+class Checker(ty_checker.Checker):
+    __slots__ = ()
 
     def __init__(self, name, sds):
         logger.info('> Init Chekcer data')
         logger.info(f'name = {name}')
 
-        self._patches = {}
-
-        self.set_name(name)
-        self.set_patches(sds)
+        super().__init__(name, sds)
 
     #=================================#
     # Set / Get
     #=================================#
-    # Name
-    def set_name(self, name):
-        self._name = name
-
-    def name(self):
-        return self._name
-
     def set_patches(self, sds):
-        for name in sds:
-            logger.info(name)
-            sd = sds.get(name)
-            patch = Material(name, sd)
-
-            self.set_patch(name, patch)
-
-    # patch
-    def set_patch(self, name, path):
-        self._patches[name] = path
+        self.set_sds(sds)
 
 @dataclasses.dataclass
 class Scene:
     _cmfs: list = None
     _colorspace: str = None
-    _chekcer: Checker = None
+    _adaptation: str = None
+    _checker: Checker = None
     _light: Material = None
+    _shape: tuple = (380, 780, 5)
     _width: int = 480
     _height: int = 320
     _default_color = QtGui.QColor('Blue')
+    _default_colorspace = 'sRGB'
+    _gap: int = 4
+    _buffers: list = dataclasses.field(default_factory=list)
+    _buffer: np.ndarray = None
+    _index: np.ndarray = None
+    _index_key: tuple = None
+    _memo: dict = dataclasses.field(default_factory=dict)
+    _update_checker: bool = True
+
+    # ステージ: 依存する入力 / ステージ
+    DEPENDENCIES = {
+        'values': ('checker', 'shape'),
+        'whitepoint': ('light', 'cmfs', 'shape'),
+        'xyz': ('values', 'light', 'cmfs'),
+        'linear': ('xyz', 'whitepoint', 'colorspace', 'adaptation'),
+        'rgb': ('linear', ),
+        'palette': ('rgb', ),
+        'image': ('palette', 'size'),
+    }
 
     #=================================#
     # Set / Get
     #=================================#
     def set_colorspace(self, colorspace):
-        self._colorspace = colorspace
+        if colorspace != self._colorspace:
+            self._colorspace = colorspace
+            self.invalidate('colorspace')
     
     def colorspace(self):
         return self._colorspace
 
+    def set_adaptation(self, method):
+        if method != self._adaptation:
+            self._adaptation = method
+            self.invalidate('adaptation')
+
+    def adaptation(self):
+        return self._adaptation
+
     def set_light(self, name, ilm):
-        light = Material(name, ilm)
-        self._light = light
+        light = self._light
+        if light is not None and light._name == name and light._spectral_distribution is ilm:
+            return
+
+        self._light = Material(name, ilm)
+        self.invalidate('light')
 
     def set_cmfs(self, cmfs):
-        self._cmfs = cmfs
+        if cmfs is not self._cmfs:
+            self._cmfs = cmfs
+            self.invalidate('cmfs')
 
     def set_checker(self, checker):
-        self._checker = checker
+        if checker is not self._checker:
+            self._checker = checker
+            self.invalidate('checker')
+
+    def checker(self):
+        return self._checker
+
+    def set_shape(self, shape):
+        if tuple(shape) != tuple(self._shape):
+            self._shape = shape
+            self.invalidate('shape')
+
+    def shape(self):
+        return self._shape
+
+    def set_size(self, width, height):
+        if (width, height) != (self._width, self._height):
+            self._width = width
+            self._height = height
+            self.invalidate('size')
 
     def width(self):
         return self._width
@@ -94,6 +146,150 @@ class Scene:
     def default_color(self):
         return self._default_color
 
+    def buffer(self):
+        return self._buffer
+
+    #=================================#
+    # Methods
+    #=================================#
+    def invalidate(self, name):
+        # name に依存するステージを下流までまとめて捨てる
+        # 途中のステージが無くても辿る (xyz がディスクから来た時は values が無い)
+        for stage, inputs in self.DEPENDENCIES.items():
+            if name in inputs:
+                self._memo.pop(stage, None)
+                self.invalidate(stage)
+
+    def memo(self, stage, func):
+        if not stage in self._memo:
+            self._memo[stage] = func()
+
+        return self._memo[stage]
+
+    def is_valid(self, stage):
+        return stage in self._memo
+
+    def whitepoint(self):
+        return self.memo('whitepoint', lambda: ty_spectral.whitepoint(
+            self._cmfs, self._light._spectral_distribution, self.shape()))
+
+    def values(self):
+        return self.memo('values', lambda: self._checker.values(self.shape()))
+
+    def xyz(self):
+        def func():
+            result = ty_spectral.render(
+                self._checker.sds(), self._cmfs, self._light._spectral_distribution,
+                self.shape(), self.values)
+            if self._update_checker:
+                self._checker.set_xyzs(result)
+            return result
+
+        return self.memo('xyz', func)
+
+    def display_colorspace(self):
+        # 'Spectrum' は sRGB で表示
+        name = self.colorspace()
+        if not name in colour.RGB_COLOURSPACES:
+            name = self._default_colorspace
+
+        return name
+
+    def linear(self):
+        # 色順応は RGB 行列に含まれるので、ここは 3x3 の掛け算だけ
+        return self.memo('linear', lambda: ty_colorimetry.XYZ_to_RGB(
+            self.xyz(), self.display_colorspace(), self.whitepoint(), self.adaptation()))
+
+    def rgb(self):
+        def func():
+            rgb = np.clip(self.linear(), 0, 1)
+            return colour.RGB_COLOURSPACES[self.display_colorspace()].cctf_encoding(rgb)
+
+        return self.memo('rgb', func)
+
+    def palette(self, rgb):
+        # (N + 1, 3) uint8, 最後は背景色
+        color = self.default_color()
+        result = np.empty((len(rgb) + 1, 3), dtype=np.uint8)
+        result[:-1] = np.round(rgb * 255)
+        result[-1] = (color.red(), color.green(), color.blue())
+
+        return result
+
+    def patch_index(self, count):
+        # (h, w) の各ピクセルがどのパッチか、隙間は count
+        w, h = self.size()
+        key = (w, h, count, self._gap)
+        if self._index_key == key:
+            return self._index
+
+        cols = max(1, round(math.sqrt(count * w / h)))
+        rows = math.ceil(count / cols)
+
+        def axis(length, num):
+            cell = length / num
+            pos = np.arange(length) + 0.5
+            index = np.minimum((pos // cell).astype(np.intp), num - 1)
+            local = pos - index * cell
+            inside = (local > self._gap / 2) & (local < cell - self._gap / 2)
+            return index, inside
+
+        col, col_inside = axis(w, cols)
+        row, row_inside = axis(h, rows)
+
+        result = row[:, np.newaxis] * cols + col[np.newaxis, :]
+        inside = row_inside[:, np.newaxis] & col_inside[np.newaxis, :]
+        result[~inside | (result >= count)] = count
+
+        self._index = result
+        self._index_key = key
+
+        return result
+
+    def new_buffer(self):
+        # 2枚を交互に使う (表示中のバッファに次の描画を書き込まない)
+        w, h = self.size()
+        if len(self._buffers) != 2 or self._buffers[0].shape != (h, w, 3):
+            self._buffers = [np.empty((h, w, 3), dtype=np.uint8) for _ in range(2)]
+
+        self._buffers.reverse()
+        self._buffer = self._buffers[0]
+
+        return self._buffer
+
+    def render(self, progress=None):
+        # progress(percent, message) が False を返したら中断して None
+        def report(percent, message):
+            return progress is None or progress(percent, message)
+
+        if not self.is_valid('xyz'):
+            if not report(0, 'Integrate'):
+                return None
+            self.xyz()
+
+        if not self.is_valid('palette'):
+            if not report(50, 'Convert'):
+                return None
+            self.memo('palette', lambda: self.palette(self.rgb()))
+
+        if not self.is_valid('image'):
+            if not report(75, 'Rasterise'):
+                return None
+            self.memo('image', self.rasterise)
+
+        report(100, 'Done')
+
+        return self._memo['image']
+
+    def rasterise(self):
+        with STATS.stage('rasterise'):
+            palette = self._memo['palette']
+            index = self.patch_index(len(palette) - 1)
+            buffer = self.new_buffer()
+            np.take(palette, index, axis=0, out=buffer)
+
+        return buffer
+
 class TyColorChecker_v2:
     script_updated = 'JAN 20 2021'
     script_version = 'v2.0.0'
@@ -111,9 +307,28 @@ class TyColorChecker_v2:
 
         self._scene = Scene()
 
+        # 粗い波長間隔で先に見せる用, checker / light / cmfs は同じものを共有
+        self._preview = Scene(_shape=PREVIEW_SHAPE, _update_checker=False)
+
+        # アトラス用, タイルごとに光源を変える
+        self._tile = Scene(_update_checker=False)
+
+        # (checker, illuminant, cmfs, colorspace, adaptation, shape) -> (2, N, 3)
+        self._tiles = ty_cache.ArrayCache(max_bytes=8 * 1024 * 1024)
+
+        # name -> Checker, 切り替えるたびに SDS_COLOURCHECKERS から作り直さない
+        self._checkers = {}
+
+        # (colorspace, cmfs) -> RGBA
+        self._diagrams = ty_cache.ArrayCache(max_bytes=32 * 1024 * 1024)
+
     def init_logger(self):
         logger.propagate = False
 
+        # インスタンスを作るたびに handler を増やさない
+        if logger.handlers:
+            return logger
+
         stream_handler = logging.StreamHandler()
         stream_handler.setLevel(logging.DEBUG)
         stream_handler.setFormatter(logging.Formatter(
@@ -132,52 +347,183 @@ class TyColorChecker_v2:
     def default_color(self):
         return self._scene.default_color()
 
+    def scenes(self):
+        return [self._scene, self._preview, self._tile]
+
     def set_colorspace(self, name):
         logger.info(f'> Set Colorspace = {name}')
-        self._scene.set_colorspace(name)
+        for scene in self.scenes():
+            scene.set_colorspace(name)
 
     def set_illuminant(self, name):
         logger.info(f'> Set Light = {name}')
         ilm = colour.SDS_ILLUMINANTS.get(name)
-        self._scene.set_light(name, ilm)
+        for scene in self.scenes():
+            scene.set_light(name, ilm)
 
     def set_cmfs(self, name):
         logger.info(f'> Set CMFs = {name}')
         cmfs = colour.MSDS_CMFS.get(name)
-        self._scene.set_cmfs(cmfs)
+        for scene in self.scenes():
+            scene.set_cmfs(cmfs)
 
     def set_checker(self, name):
+        checker = self._scene.checker()
+        if checker is not None and checker.name() == name:
+            return
+
         logger.info(f'> Set Checker = {name}')
-        sds = colour.characterisation.SDS_COLOURCHECKERS.get(name)
-        checker = Checker(name, sds)
-        self._scene.set_checker(checker)
+        if not name in self._checkers:
+            sds = colour.characterisation.SDS_COLOURCHECKERS.get(name)
+            self._checkers[name] = Checker(name, sds)
+
+        checker = self._checkers[name]
+        for scene in self.scenes():
+            scene.set_checker(checker)
+
+    def set_adaptation(self, method):
+        logger.info(f'> Set Adaptation = {method}')
+        for scene in self.scenes():
+            scene.set_adaptation(method)
+
+    def adaptations(self):
+        return list(ty_colorimetry.ADAPTATION_METHODS)
+
+    def set_shape(self, shape):
+        logger.info(f'> Set Shape = {shape}')
+        self._scene.set_shape(shape)
+        self._tile.set_shape(shape)
+
+    def shape(self):
+        return self._scene.shape()
+
+    def set_preview_shape(self, shape):
+        self._preview.set_shape(shape)
+
+    def preview_shape(self):
+        return self._preview.shape()
+
+    def needs_preview(self):
+        # 積分からやり直す時だけ、プレビューの方が粗い時だけ
+        return (not self._scene.is_valid('xyz')
+                and self.preview_shape()[2] > self.shape()[2])
 
     #=================================#
     # Name List
     #=================================#
     def colorspaces(self):
-        return sorted(colour.RGB_COLOURSPACES.keys())
+        return ty_registry.names('colorspaces')
     
     def illuminants(self):
-        return sorted(colour.SDS_ILLUMINANTS.keys())
+        return ty_registry.names('illuminants')
 
     def cmfs(self):
-        return sorted(colour.MSDS_CMFS.keys())
+        return ty_registry.names('cmfs')
 
     def checkers(self):
-        return sorted(colour.characterisation.SDS_COLOURCHECKERS.keys())
+        return ty_registry.names('checkers')
+
+    def references(self):
+        return ty_registry.names('references')
     
     #=================================#
     # Methods
     #=================================#
-    def render(self):
-        logger.info(f'> Rendering')
-        # self._scene.render()
+    def is_ready(self):
+        scene = self._scene
+        for value, label in [
+            (scene.checker(), 'Checker'),
+            (scene._light, 'Light'),
+            (scene._cmfs, 'CMFs'),
+        ]:
+            if value is None:
+                logger.warning(f'{label} is not set.')
+                return False
+
+        return True
+
+    def render(self, progress=None, preview=False):
+        logger.info(f'> Rendering' + (' (Preview)' if preview else ''))
+
+        if not self.is_ready():
+            return None
+
+        scene = self._preview if preview else self._scene
+        return scene.render(progress)
+
+    # 画像にしないで値だけ, Scene のキャッシュはそのまま使う
+    def result(self):
+        if not self.is_ready():
+            return None
+
+        scene = self._scene
+        return {
+            'names': scene.checker().names(),
+            'xyz': scene.xyz(),
+            'whitepoint': scene.whitepoint(),
+            'linear': scene.linear(),
+            'rgb': scene.rgb(),
+        }
+
+    # render() の結果を CCS_COLOURCHECKERS と比較
+    def evaluate(self, reference='ColorChecker24 - After November 2014',
+                 method='CIE 2000', adaptation=None):
+        logger.info(f'> Evaluate = {reference} / {method}')
+
+        if not self.is_ready():
+            return None
+
+        if not reference in self.references():
+            logger.warning(f'"{reference}" is not found.')
+            return None
+
+        checker = self._scene.checker()
+        names, xyz, whitepoint = ty_colorimetry.reference(reference)
+        index = ty_colorimetry.match(checker.names(), names)
+        if index is None:
+            logger.warning('Patches do not match.')
+            return None
+
+        difs = ty_colorimetry.delta_E(
+            self._scene.xyz(), self._scene.whitepoint(),
+            xyz[index], whitepoint, method, adaptation)
+        checker.set_difs(difs)
+
+        return ty_colorimetry.summary(difs, checker.names())
+
+    # checker x illuminant x cmfs -> (checker, illuminant, observer, patch, 3)
+    def sweep(self, checkers, illuminants, cmfs, shape=None):
+        logger.info(f'> Sweep = {len(checkers)} x {len(illuminants)} x {len(cmfs)}')
+
+        if shape is None:
+            shape = self.shape()
+
+        names = [
+            (checkers, self.checkers()),
+            (illuminants, self.illuminants()),
+            (cmfs, self.cmfs()),
+        ]
+        for items, keys in names:
+            for name in items:
+                if not name in keys:
+                    logger.warning(f'"{name}" is not found.')
+                    return None
+
+        result = ty_spectral.sweep(
+            [colour.characterisation.SDS_COLOURCHECKERS.get(name) for name in checkers],
+            [colour.SDS_ILLUMINANTS.get(name) for name in illuminants],
+            [colour.MSDS_CMFS.get(name) for name in cmfs],
+            shape
+        )
+
+        return result
 
     #=================================#
     # Show
     #=================================#
     def show_colorspace(self, name):
+        import matplotlib.pyplot as plt
+
         style = {
         # Figure Size Settings
         'figure.figsize': (8.0, 7.0)
@@ -189,6 +535,123 @@ class TyColorChecker_v2:
         colour.plotting.colour_style()
         plt.style.use(style)
         colour.plotting.plot_RGB_colourspaces_in_chromaticity_diagram_CIE1931(name);
+
+    #=================================#
+    # Atlas
+    #=================================#
+    def tile_key(self, illuminant):
+        scene = self._tile
+        return (scene.checker().name(), illuminant, scene._cmfs.name,
+                scene.colorspace(), scene.adaptation(), tuple(scene.shape()))
+
+    def tile(self, illuminant):
+        # (2, N, 3) linear / cctf 付きの RGB, 条件が同じなら描き直さない
+        def func():
+            scene = self._tile
+            scene.set_light(illuminant, colour.SDS_ILLUMINANTS.get(illuminant))
+            return np.stack([scene.linear(), scene.rgb()])
+
+        return self._tiles.get(self.tile_key(illuminant), func)
+
+    def atlas_layout(self, count, columns=None, tile_size=TILE_SIZE):
+        # [(x, y, w, h), ...] タイルの位置, 名前の帯は含まない
+        w, h = tile_size
+        columns = columns or max(1, math.ceil(math.sqrt(count)))
+        return [
+            ((i % columns) * w, (i // columns) * (h + LABEL_HEIGHT), w, h)
+            for i in range(count)
+        ]
+
+    def atlas(self, illuminants, columns=None, tile_size=TILE_SIZE, linear=False,
+              progress=None):
+        # 光源ごとのチェッカーを並べた1枚 -> (h, w, 3) uint8, linear なら float32
+        # progress(i, count) が False を返したら中断して None
+        scene = self._tile
+        if scene.checker() is None or scene._cmfs is None:
+            logger.warning('Checker / CMFs is not set.')
+            return None
+
+        logger.info(f'> Atlas = {len(illuminants)} illuminants')
+
+        layout = self.atlas_layout(len(illuminants), columns, tile_size)
+        width = max(x + w for x, _, w, _ in layout)
+        height = max(y + h for _, y, _, h in layout) + LABEL_HEIGHT
+
+        scene.set_size(*tile_size)
+        index = scene.patch_index(scene.checker().count())
+
+        if linear:
+            result = np.zeros((height, width, 3), dtype=np.float32)
+            background = np.zeros(3)
+        else:
+            color = scene.default_color()
+            result = np.empty((height, width, 3), dtype=np.uint8)
+            result[...] = (color.red(), color.green(), color.blue())
+            background = None
+
+        for i, (name, (x, y, w, h)) in enumerate(zip(illuminants, layout)):
+            if progress is not None and not progress(i, len(illuminants)):
+                return None
+
+            values = self.tile(name)
+            if linear:
+                palette = np.vstack([values[0], background])
+            else:
+                palette = scene.palette(values[1])
+            result[y:y + h, x:x + w] = palette[index]
+
+        return result
+
+    def write_atlas(self, path, image):
+        # .exr は linear の float, それ以外は matplotlib で書き出す
+        logger.info(f'> Write Atlas = {path}')
+
+        if path.lower().endswith('.exr'):
+            try:
+                colour.write_image(np.asarray(image, dtype=np.float32), path)
+            except ImportError as e:
+                logger.warning(f'Failed to write "{path}": {e}')
+                return None
+        else:
+            import matplotlib.image
+            matplotlib.image.imsave(path, image)
+
+        return path
+
+    def has_colorspace_diagram(self, name, cmfs):
+        return (name, cmfs) in self._diagrams
+
+    def colorspace_diagram(self, name, cmfs):
+        # Agg でオフスクリーン描画 -> (h, w, 4) uint8
+        def func():
+            # colour の plotting は pyplot.gcf() を呼ぶので、別スレッドで
+            # Qt の figure を作らないように pyplot を import する前に Agg にする
+            import matplotlib
+            matplotlib.use('Agg')
+            import matplotlib.pyplot as plt
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from matplotlib.figure import Figure
+
+            logger.info(f'> Draw Colorspace Diagram = {name}, {cmfs}')
+
+            colorspaces = [] if name == 'Spectrum' else [name]
+            style = colour.plotting.colour_style(use_style=False)
+            style['figure.figsize'] = (8.0, 7.0)
+
+            with matplotlib.rc_context(style):
+                figure = Figure()
+                canvas = FigureCanvasAgg(figure)
+                axes = figure.add_subplot()
+                colour.plotting.plot_RGB_colourspaces_in_chromaticity_diagram_CIE1931(
+                    colorspaces, cmfs=cmfs, axes=axes, standalone=False)
+                canvas.draw()
+
+            # gcf() で出来た使わない figure も捨てる
+            plt.close('all')
+
+            return np.array(canvas.buffer_rgba())
+
+        return self._diagrams.get((name, cmfs), func)
 ######################################################
 # View
 ######################################################
@@ -275,6 +738,7 @@ class RenderView(QtWidgets.QWidget):
         super().__init__(parent)
 
         self._image = None
+        self._buffer = None
         self._pixmap = None
 
         layout = QtWidgets.QVBoxLayout(self)
@@ -286,24 +750,185 @@ class RenderView(QtWidgets.QWidget):
     # Set / Get
     #=================================#
     def set_image(self, image):
+        # np.ndarray (h, w, 3) uint8 はコピーせずに QImage で包む
+        if isinstance(image, np.ndarray):
+            self._buffer = image
+            h, w, c = image.shape
+            fmt = QtGui.QImage.Format_RGBA8888 if c == 4 else QtGui.QImage.Format_RGB888
+            image = QtGui.QImage(image.data, w, h, image.strides[0], fmt)
+
         self._image = image
         self.set_pixmap(self._image)
 
     def set_pixmap(self, image):
-        pixmap = QtGui.QPixmap(image)
+        pixmap = QtGui.QPixmap.fromImage(image)
         self.view.setPixmap(pixmap)
 
+class RenderSignals(QtCore.QObject):
+    progress = QtCore.Signal(int, int, str)
+    preview = QtCore.Signal(int, object)
+    finished = QtCore.Signal(int, object)
+
+class RenderWorker(QtCore.QRunnable):
+    # signals は View が持つ (QRunnable と一緒に作ると先に消されることがある)
+    def __init__(self, core, job, params, signals):
+        super().__init__()
+
+        self.core = core
+        self.signals = signals
+
+        self._job = job
+        self._params = params
+        self._cancelled = False
+
+    #=================================#
+    # Methods
+    #=================================#
+    def job(self):
+        return self._job
+
+    def cancel(self):
+        self._cancelled = True
+
+    def is_cancelled(self):
+        return self._cancelled
+
+    def progress(self, percent, message):
+        if self._cancelled:
+            return False
+
+        self.signals.progress.emit(self._job, percent, message)
+        return True
+
+    def run(self):
+        colorspace, illuminant, cmfs, checker = self._params
+
+        for func, value in [
+            (self.core.set_checker, checker),
+            (self.core.set_illuminant, illuminant),
+            (self.core.set_cmfs, cmfs),
+            (self.core.set_colorspace, colorspace),
+        ]:
+            if self._cancelled:
+                return
+            func(value)
+
+        # 積分からやり直す時は粗いプレビューを先に出す
+        if self.core.needs_preview():
+            image = self.core.render(preview=True)
+            if image is None or self._cancelled:
+                return
+            self.signals.preview.emit(self._job, image)
+
+        image = self.core.render(self.progress)
+
+        if image is not None and not self._cancelled:
+            self.signals.finished.emit(self._job, image)
+
+class DiagramSignals(QtCore.QObject):
+    finished = QtCore.Signal(object, object)
+
+class DiagramWorker(QtCore.QRunnable):
+    def __init__(self, core, key, signals):
+        super().__init__()
+
+        self.core = core
+        self.signals = signals
+
+        self._key = key
+
+    def run(self):
+        image = self.core.colorspace_diagram(*self._key)
+        self.signals.finished.emit(self._key, image)
+
+class AtlasSignals(QtCore.QObject):
+    progress = QtCore.Signal(int, int, str)
+    finished = QtCore.Signal(int, object, object)
+    failed = QtCore.Signal(int, str)
+
+class AtlasWorker(QtCore.QRunnable):
+    # 光源を全部並べたアトラス, path があれば linear の EXR も書く
+    def __init__(self, core, job, params, illuminants, signals, path=None):
+        super().__init__()
+
+        self.core = core
+        self.signals = signals
+
+        self._job = job
+        self._params = params
+        self._illuminants = illuminants
+        self._path = path
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def progress(self, index, count):
+        if self._cancelled:
+            return False
+
+        self.signals.progress.emit(self._job, int(100 * index / count), self._illuminants[index])
+        return True
+
+    def run(self):
+        colorspace, cmfs, checker = self._params
+
+        self.core.set_checker(checker)
+        self.core.set_cmfs(cmfs)
+        self.core.set_colorspace(colorspace)
+
+        image = self.core.atlas(self._illuminants, progress=self.progress)
+        if image is None or self._cancelled:
+            return
+
+        path = self._path
+        if path is not None:
+            linear = self.core.atlas(self._illuminants, linear=True)
+            if self.core.write_atlas(path, linear) is None:
+                path = None
+
+        self.signals.finished.emit(self._job, image, path)
+
+        if self._path is not None and path is None:
+            self.signals.failed.emit(self._job, f'Failed to export {self._path}')
+
 class View(QtWidgets.QMainWindow):
     def __init__(self, Core, parent=None):
         super().__init__(parent)
 
         self.core = Core
 
+        # Scene は1つなので描画は1スレッドで順番に
+        self._pool = QtCore.QThreadPool(self)
+        self._pool.setMaxThreadCount(1)
+        self._job = 0
+        self._worker = None
+        self._ready = False
+
+        # コンボボックスを続けて変えた時は最後の1回だけ描画
+        self._debounce = QtCore.QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(DEBOUNCE)
+        self._debounce.timeout.connect(self.render)
+
+        self._diagram_pool = QtCore.QThreadPool(self)
+        self._diagram_pool.setMaxThreadCount(1)
+        self._diagram = None
+
+        # アトラスも Scene を触るので同じ _pool で描く
+        self._atlas_job = 0
+        self._atlas_worker = None
+        self._atlas_names = []
+        self._export = None
+
         self.init()
         self.setup()
 
         self.resize(960, 480)
 
+        self._ready = True
+        self.render()
+
     #=================================#
     # init
     #=================================#
@@ -324,11 +949,26 @@ class View(QtWidgets.QMainWindow):
         self.menu_file = QtWidgets.QMenu('File', self)
         self.menu_bar.addAction(self.menu_file.menuAction())
 
+        action = QtWidgets.QAction('Export Atlas...', self)
+        action.triggered.connect(self.export_atlas)
+        self.menu_file.addAction(action)
+
+        self.menu_file.addSeparator()
+
         action = QtWidgets.QAction('Exit', self)
         action.setShortcut(QtGui.QKeySequence('Ctrl+Q'))
         action.triggered.connect(lambda: self.close())
         self.menu_file.addAction(action)
 
+        # View
+        self.menu_view = QtWidgets.QMenu('View', self)
+        self.menu_bar.addAction(self.menu_view.menuAction())
+
+        action = QtWidgets.QAction('Atlas', self)
+        action.setShortcut(QtGui.QKeySequence('Ctrl+A'))
+        action.triggered.connect(lambda: self.render_atlas())
+        self.menu_view.addAction(action)
+
     def init_central_widget(self):
         logger.info('> Gui: init_central_widget')
 
@@ -340,8 +980,20 @@ class View(QtWidgets.QMainWindow):
         self.menu_widget = MenuWidget()
         layout.addWidget(self.menu_widget)
 
+        self.tab_widget = QtWidgets.QTabWidget()
+        layout.addWidget(self.tab_widget)
+
         self.render_widget = RenderView()
-        layout.addWidget(self.render_widget)
+        self.tab_widget.addTab(self.render_widget, 'Render')
+
+        self.diagram_widget = RenderView()
+        self.tab_widget.addTab(self.diagram_widget, 'Chromaticity')
+
+        self.atlas_widget = RenderView()
+        scroll = QtWidgets.QScrollArea()
+        scroll.setWidget(self.atlas_widget)
+        scroll.setWidgetResizable(True)
+        self.tab_widget.addTab(scroll, 'Atlas')
 
         image = self.new_image()
         self.render_widget.set_image(image)
@@ -357,6 +1009,29 @@ class View(QtWidgets.QMainWindow):
     def init_signals(self):
         logger.info('> Init Signals')
         self.menu_widget.colorspace.button.clicked.connect(self.show_colorspace)
+        self.menu_widget.render_button.clicked.connect(self.render)
+
+        # worker からの通知, 古い job / key のものは受け取った側で捨てる
+        self._render_signals = RenderSignals(self)
+        self._render_signals.progress.connect(self.render_progress)
+        self._render_signals.preview.connect(self.render_preview)
+        self._render_signals.finished.connect(self.render_finished)
+
+        self._diagram_signals = DiagramSignals(self)
+        self._diagram_signals.finished.connect(self.diagram_finished)
+
+        self._atlas_signals = AtlasSignals(self)
+        self._atlas_signals.progress.connect(self.atlas_progress)
+        self._atlas_signals.finished.connect(self.atlas_finished)
+        self._atlas_signals.failed.connect(self.atlas_failed)
+
+        for ui in [
+            self.menu_widget.colorspace,
+            self.menu_widget.ilm,
+            self.menu_widget.cmfs,
+            self.menu_widget.checker,
+        ]:
+            ui.combobox.currentTextChanged.connect(self.request_render)
 
     #=================================#
     # Setup
@@ -369,7 +1044,7 @@ class View(QtWidgets.QMainWindow):
         items = ['Spectrum']
         items.extend(self.core.colorspaces())
         ui.addItems(items)
-        pprint(items)
+        logger.info(f'{len(items)} items')
         self.set_colorspace('Spectrum')
 
         # Illuminants
@@ -378,7 +1053,7 @@ class View(QtWidgets.QMainWindow):
         ui.clear()
         items = self.core.illuminants()
         ui.addItems(items)
-        pprint(items)
+        logger.info(f'{len(items)} items')
         ui.set('D65')
 
         # CMFs
@@ -387,7 +1062,7 @@ class View(QtWidgets.QMainWindow):
         ui.clear()
         items = self.core.cmfs()
         ui.addItems(items)
-        pprint(items)
+        logger.info(f'{len(items)} items')
         ui.set('CIE 1931 2 Degree Standard Observer')
 
         # Checker
@@ -396,7 +1071,7 @@ class View(QtWidgets.QMainWindow):
         ui.clear()
         items = self.core.checkers()
         ui.addItems(items)
-        pprint(items)
+        logger.info(f'{len(items)} items')
         ui.set('ISO 17321-1')
 
     #=================================#
@@ -414,6 +1089,75 @@ class View(QtWidgets.QMainWindow):
     def colorspace(self):
         return self.menu_widget.colorspace.get()
 
+    def illuminant(self):
+        return self.menu_widget.ilm.get()
+
+    def cmfs(self):
+        return self.menu_widget.cmfs.get()
+
+    def checker(self):
+        return self.menu_widget.checker.get()
+
+    #=================================#
+    # render
+    #=================================#
+    def request_render(self):
+        if self._ready:
+            self._debounce.start()
+
+    def render(self):
+        if not self._ready:
+            return
+        self._debounce.stop()
+
+        # 新しいリクエストが来たら古いものは捨てる
+        # clear() だと待っているアトラスまで消えるので描画の分だけ取り出す
+        if self._worker is not None:
+            self._worker.cancel()
+            self._pool.tryTake(self._worker)
+
+        self._job += 1
+        params = (self.colorspace(), self.illuminant(), self.cmfs(), self.checker())
+
+        worker = RenderWorker(self.core, self._job, params, self._render_signals)
+        self._worker = worker
+
+        self.statusbar.showMessage('Rendering...')
+        self._pool.start(worker)
+
+    def render_progress(self, job, percent, message):
+        if job != self._job:
+            return
+
+        self.statusbar.showMessage(f'Rendering... {percent}% {message}')
+
+    def render_preview(self, job, image):
+        if job != self._job:
+            return
+
+        self.render_widget.set_image(image)
+
+    def render_finished(self, job, image):
+        if job != self._job:
+            return
+
+        self._worker = None
+        self.render_widget.set_image(image)
+        self.statusbar.showMessage('Rendered', 2000)
+
+    def closeEvent(self, event):
+        for worker in [self._worker, self._atlas_worker]:
+            if worker is not None:
+                worker.cancel()
+        self._debounce.stop()
+        self._pool.clear()
+        self._pool.waitForDone()
+
+        self._diagram_pool.clear()
+        self._diagram_pool.waitForDone()
+
+        super().closeEvent(event)
+
     #=================================#
     # update
     #=================================#
@@ -427,9 +1171,115 @@ class View(QtWidgets.QMainWindow):
     def show_colorspace(self):
         logger.info('> Show Colorspace')
 
-        name = self.colorspace()
-        logger.info(name)
-        self.core.show_colorspace(name)
+        key = (self.colorspace(), self.cmfs())
+        logger.info(key)
+
+        self._diagram = key
+        self.tab_widget.setCurrentWidget(self.diagram_widget)
+
+        if self.core.has_colorspace_diagram(*key):
+            self.diagram_finished(key, self.core.colorspace_diagram(*key))
+            return
+
+        worker = DiagramWorker(self.core, key, self._diagram_signals)
+
+        self.statusbar.showMessage(f'Drawing... {key[0]}')
+        self._diagram_pool.clear()
+        self._diagram_pool.start(worker)
+
+    def diagram_finished(self, key, image):
+        if key != self._diagram:
+            return
+
+        self.diagram_widget.set_image(image)
+        self.statusbar.showMessage(f'{key[0]} / {key[1]}', 2000)
+
+    #=================================#
+    # atlas
+    #=================================#
+    def render_atlas(self, path=None):
+        logger.info('> Render Atlas')
+
+        if self._atlas_worker is not None:
+            self._atlas_worker.cancel()
+
+        self._atlas_job += 1
+        params = (self.colorspace(), self.cmfs(), self.checker())
+        illuminants = self.core.illuminants()
+
+        worker = AtlasWorker(
+            self.core, self._atlas_job, params, illuminants, self._atlas_signals, path)
+        self._atlas_worker = worker
+        self._atlas_names = illuminants
+
+        self.tab_widget.setCurrentIndex(self.tab_widget.count() - 1)
+        self.statusbar.showMessage('Rendering Atlas...')
+        self._pool.start(worker)
+
+    def export_atlas(self):
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self, 'Export Atlas', 'atlas.png', 'Images (*.png *.tif *.jpg);;OpenEXR (*.exr)')
+        if not path:
+            return
+
+        # EXR は linear のまま core で書く, それ以外は名前付きの表示をそのまま保存
+        if path.lower().endswith('.exr'):
+            self.render_atlas(path)
+        elif self.atlas_widget._image is not None and self._atlas_worker is None:
+            self.save_atlas(path)
+        else:
+            self._export = path
+            self.render_atlas()
+
+    def atlas_progress(self, job, percent, message):
+        if job != self._atlas_job:
+            return
+
+        self.statusbar.showMessage(f'Rendering Atlas... {percent}% {message}')
+
+    def atlas_image(self, image):
+        # 各タイルの下に光源の名前を書く
+        h, w, _ = image.shape
+        result = QtGui.QImage(image.data, w, h, image.strides[0], QtGui.QImage.Format_RGB888).copy()
+
+        painter = QtGui.QPainter(result)
+        painter.setPen(QtGui.QColor(220, 220, 220))
+        option = QtGui.QTextOption(QtCore.Qt.AlignCenter)
+        layout = self.core.atlas_layout(len(self._atlas_names))
+        for name, (x, y, tw, th) in zip(self._atlas_names, layout):
+            painter.drawText(QtCore.QRectF(x, y + th, tw, LABEL_HEIGHT), name, option)
+        painter.end()
+
+        return result
+
+    def atlas_finished(self, job, image, path):
+        if job != self._atlas_job:
+            return
+
+        self._atlas_worker = None
+        self.atlas_widget.set_image(self.atlas_image(image))
+
+        if self._export is not None:
+            path, self._export = self._export, None
+            self.save_atlas(path)
+        elif path is not None:
+            self.statusbar.showMessage(f'Exported {path}', 2000)
+        else:
+            self.statusbar.showMessage('Rendered Atlas', 2000)
+
+    def atlas_failed(self, job, message):
+        if job != self._atlas_job:
+            return
+
+        logger.warning(message)
+        self.statusbar.showMessage(message, 5000)
+
+    def save_atlas(self, path):
+        # 名前付きの表示をそのまま保存
+        if self.atlas_widget._image.save(path):
+            self.statusbar.showMessage(f'Exported {path}', 2000)
+        else:
+            self.atlas_failed(self._atlas_job, f'Failed to export {path}')
     
 
 def debug():
@@ -450,6 +1300,7 @@ def debug():
     # checker
     checkers = cc.checkers()
     pprint(checkers)
+    logger.info(f'> Startup = {ty_registry.startup_time():.3f} sec')
 
     cc.set_colorspace('sRGB')
     cc.set_illuminant('D65')
@@ -463,6 +1314,9 @@ def main():
     core = TyColorChecker_v2()
     view = View(core)
     view.show()
+
+    QtCore.QTimer.singleShot(0, lambda: logger.info(
+        f'> Startup = {ty_registry.startup_time():.3f} sec'))
     sys.exit(app.exec_())
 
 if __name__ == '__main__':
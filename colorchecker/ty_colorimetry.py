@@ -0,0 +1,175 @@
+import logging
+import numpy as np
+
+import ty_cache
+import ty_registry
+from ty_stats import STATS
+
+colour = ty_registry.colour
+
+logger = logging.getLogger(__name__)
+
+# Von Kries 系の色順応
+ADAPTATION_METHODS = ['Bradford', 'CAT02', 'CAT16']
+
+#=================================#
+# Cache
+#=================================#
+# (whitepoint, colorspace, method) -> (3, 3)
+CACHE = ty_cache.ArrayCache(max_bytes=4 * 1024 * 1024)
+
+def whitepoint_key(whitepoint):
+    if whitepoint is None:
+        return None
+
+    return tuple(np.round(np.asarray(whitepoint, dtype=np.float64), 10).tolist())
+
+#=================================#
+# Matrix
+#=================================#
+def colorspace_whitepoint(name):
+    # XYZ (Y = 1.0)
+    colorspace = colour.RGB_COLOURSPACES[name]
+    return colour.xy_to_XYZ(colorspace.whitepoint)
+
+def matrix_XYZ_to_RGB(name, whitepoint=None, method=None):
+    # whitepoint : レンダリング光源の XYZ, method = None なら色順応しない
+    if method is not None and not method in ADAPTATION_METHODS:
+        logger.warning(f'"{method}" is not found.')
+        method = None
+
+    def func():
+        colorspace = colour.RGB_COLOURSPACES[name]
+        result = np.array(colorspace.matrix_XYZ_to_RGB, dtype=np.float64)
+
+        if method is not None and whitepoint is not None:
+            cat = colour.adaptation.matrix_chromatic_adaptation_VonKries(
+                np.asarray(whitepoint, dtype=np.float64),
+                colorspace_whitepoint(name),
+                transform=method,
+            )
+            result = result @ cat
+
+        return result
+
+    key = (whitepoint_key(whitepoint), name, method)
+    return CACHE.get(key, func)
+
+def matrices_XYZ_to_RGB(names, whitepoints, method=None):
+    # whitepoints (..., 3) -> (..., colorspace, 3, 3)
+    whitepoints = np.asarray(whitepoints, dtype=np.float64)
+    flat = np.reshape(whitepoints, (-1, 3))
+
+    result = np.array([
+        [matrix_XYZ_to_RGB(name, white, method) for name in names]
+        for white in flat
+    ])
+
+    return np.reshape(result, whitepoints.shape[:-1] + (len(names), 3, 3))
+
+#=================================#
+# Convert
+#=================================#
+def XYZ_to_RGB(xyz, name, whitepoint=None, method=None):
+    # (N, 3) -> (N, 3) linear
+    m = matrix_XYZ_to_RGB(name, whitepoint, method)
+    with STATS.stage('convert'):
+        return np.matmul(xyz, np.transpose(m))
+
+def RGB_to_XYZ(rgb, name):
+    # linear (N, 3) -> (N, 3), 色順応はしない
+    m = np.asarray(colour.RGB_COLOURSPACES[name].matrix_RGB_to_XYZ, dtype=np.float64)
+    with STATS.stage('convert'):
+        return np.matmul(rgb, np.transpose(m))
+
+def XYZ_to_RGBs(xyz, names, whitepoint=None, method=None):
+    # (N, 3) -> (colorspace, N, 3)
+    m = np.array([matrix_XYZ_to_RGB(name, whitepoint, method) for name in names])
+    with STATS.stage('convert'):
+        return np.einsum('nk,sjk->snj', xyz, m, optimize=True)
+
+def sweep_to_RGB(xyz, whitepoints, names, method=None):
+    # xyz         = (checker, illuminant, observer, patch, 3)
+    # whitepoints = (illuminant, observer, 3)
+    # -> (checker, illuminant, observer, colorspace, patch, 3)
+    m = matrices_XYZ_to_RGB(names, whitepoints, method)
+    with STATS.stage('convert'):
+        return np.einsum('cionk,iosjk->ciosnj', xyz, m, optimize=True)
+
+#=================================#
+# Delta E
+#=================================#
+DELTA_E_METHODS = ['CIE 1976', 'CIE 1994', 'CIE 2000']
+
+def reference(name):
+    # CCS_COLOURCHECKERS -> (names, (N, 3) XYZ, whitepoint XYZ)
+    checker = colour.CCS_COLOURCHECKERS[name]
+
+    names = tuple(checker.data.keys())
+    xyz = colour.xyY_to_XYZ(np.array(list(checker.data.values())))
+    whitepoint = colour.xy_to_XYZ(checker.illuminant)
+
+    return names, xyz, whitepoint
+
+def match(names, reference_names):
+    # names の順に並べた reference の index, 名前が違っても数が同じなら順番通り
+    if all(name in reference_names for name in names):
+        return np.array([reference_names.index(name) for name in names])
+
+    if len(names) == len(reference_names):
+        return np.arange(len(names))
+
+    return None
+
+def exposure(xyz, reference_xyz):
+    # xyz * k の Y が reference に最小二乗で合う k
+    y = np.asarray(xyz)[..., 1]
+    return np.dot(np.asarray(reference_xyz)[..., 1], y) / np.dot(y, y)
+
+def XYZ_to_Lab(xyz, whitepoint):
+    # xyz (..., N, 3), whitepoint (..., 3)
+    xy = colour.XYZ_to_xy(np.asarray(whitepoint, dtype=np.float64))
+    return colour.XYZ_to_Lab(xyz, xy[..., np.newaxis, :])
+
+def delta_E(xyz, whitepoint, reference_xyz, reference_whitepoint,
+            method='CIE 2000', adaptation=None):
+    # xyz (..., N, 3) と whitepoint (..., 3) はまとめて計算できる
+    # adaptation を指定したら reference の白色点に色順応してから比較
+    with STATS.stage('evaluate'):
+        return _delta_E(
+            xyz, whitepoint, reference_xyz, reference_whitepoint, method, adaptation)
+
+def _delta_E(xyz, whitepoint, reference_xyz, reference_whitepoint, method, adaptation):
+    whitepoint = np.asarray(whitepoint, dtype=np.float64)
+
+    if adaptation is not None:
+        xyz = colour.adaptation.chromatic_adaptation_VonKries(
+            xyz,
+            whitepoint[..., np.newaxis, :],
+            reference_whitepoint,
+            transform=adaptation,
+        )
+        whitepoint = np.asarray(reference_whitepoint, dtype=np.float64)
+
+    lab = XYZ_to_Lab(xyz, whitepoint)
+    reference_lab = XYZ_to_Lab(reference_xyz, reference_whitepoint)
+
+    return colour.delta_E(lab, reference_lab, method=method)
+
+def summary(delta_E, names=None):
+    # 最後の軸 (patch) で集計
+    delta_E = np.asarray(delta_E)
+
+    result = {
+        'mean': np.nanmean(delta_E, axis=-1),
+        'median': np.nanmedian(delta_E, axis=-1),
+        'p95': np.nanpercentile(delta_E, 95, axis=-1),
+        'max': np.nanmax(delta_E, axis=-1),
+        'std': np.nanstd(delta_E, axis=-1),
+    }
+
+    if names is not None and delta_E.ndim == 1:
+        result['worst'] = names[int(np.nanargmax(delta_E))]
+        result['patches'] = dict(zip(names, delta_E))
+
+    return result
@@ -0,0 +1,134 @@
+import logging
+import os
+import numpy as np
+
+import ty_registry
+
+colour = ty_registry.colour
+
+logger = logging.getLogger(__name__)
+
+# 撮影したチェッカー画像からパッチの値を取り出す
+#
+# 画像は丸ごと読まずに memory map して、パッチの窓の画素だけ読む
+# .npy           : np.load(mmap_mode='r')
+# .raw .bin .dat : np.memmap (shape / dtype / offset を指定)
+# .tif .tiff     : tifffile.memmap (非圧縮のみ, tifffile がある時)
+# それ以外 (EXR など) は colour.read_image で全部読む
+RAW_EXTENSIONS = ['.raw', '.bin', '.dat']
+TIFF_EXTENSIONS = ['.tif', '.tiff']
+
+# 一度に読む窓の画素数の上限 (float64 換算で約 64MB)
+CHUNK_PIXELS = 8 * 1024 * 1024 // 3
+
+#=================================#
+# Open
+#=================================#
+def open_image(path, shape=None, dtype=np.float32, offset=0):
+    # -> (h, w, c) か (h, w) の配列 (できれば np.memmap)
+    ext = os.path.splitext(path)[1].lower()
+
+    if ext == '.npy':
+        return np.load(path, mmap_mode='r')
+
+    if ext in RAW_EXTENSIONS:
+        if shape is None:
+            logger.warning(f'"{path}": shape is required for raw images.')
+            return None
+        return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=tuple(shape))
+
+    if ext in TIFF_EXTENSIONS:
+        try:
+            import tifffile
+            return tifffile.memmap(path, mode='r')
+        except ImportError:
+            logger.info('tifffile is not found.')
+        except ValueError as e:
+            # 圧縮されている
+            logger.info(f'"{path}" can not be memory mapped: {e}')
+
+    logger.info(f'Read "{path}" into memory.')
+    return colour.read_image(path)
+
+#=================================#
+# Grid
+#=================================#
+def rect_quad(x0, y0, x1, y1):
+    # 四隅 (左上, 右上, 右下, 左下)
+    return np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], dtype=np.float64)
+
+def homography(quad, rows, cols):
+    # (col, row) のマス目座標 -> 画像の (x, y)
+    src = np.array([[0, 0], [cols, 0], [cols, rows], [0, rows]], dtype=np.float64)
+    dst = np.asarray(quad, dtype=np.float64)
+
+    a = np.zeros((8, 8))
+    b = np.zeros(8)
+    for i, ((u, v), (x, y)) in enumerate(zip(src, dst)):
+        a[i * 2] = [u, v, 1, 0, 0, 0, -u * x, -v * x]
+        a[i * 2 + 1] = [0, 0, 0, u, v, 1, -u * y, -v * y]
+        b[i * 2] = x
+        b[i * 2 + 1] = y
+
+    return np.append(np.linalg.solve(a, b), 1.0).reshape(3, 3)
+
+def centres(rows, cols, quad):
+    # パッチ中心 (N, 2) の (x, y), 左上から行ごとの順番
+    v, u = np.mgrid[0:rows, 0:cols] + 0.5
+    uv = np.stack([u.ravel(), v.ravel(), np.ones(rows * cols)], axis=-1)
+
+    xy = uv @ np.transpose(homography(quad, rows, cols))
+    return xy[:, :2] / xy[:, 2:]
+
+def window(rows, cols, quad, size=0.5):
+    # size = マスに対する窓の大きさ, 一番狭いマスに合わせる -> (w, h)
+    quad = np.asarray(quad, dtype=np.float64)
+    width = min(np.linalg.norm(quad[1] - quad[0]), np.linalg.norm(quad[2] - quad[3])) / cols
+    height = min(np.linalg.norm(quad[3] - quad[0]), np.linalg.norm(quad[2] - quad[1])) / rows
+
+    return max(1, int(width * size)), max(1, int(height * size))
+
+#=================================#
+# Sample
+#=================================#
+def sample(image, points, size):
+    # points (N, 2) を中心に size (w, h) の窓の平均 -> (N, 3)
+    # 窓の画素だけ fancy index で読むので memmap でも全体は読まない
+    if image.ndim == 2:
+        image = image[..., np.newaxis]
+
+    height, width = image.shape[:2]
+    w = min(size[0], width)
+    h = min(size[1], height)
+
+    points = np.asarray(points, dtype=np.float64)
+    x0 = np.clip(np.round(points[:, 0] - w / 2).astype(np.intp), 0, width - w)
+    y0 = np.clip(np.round(points[:, 1] - h / 2).astype(np.intp), 0, height - h)
+
+    # (N, h) / (N, w)
+    rows = y0[:, np.newaxis] + np.arange(h)
+    cols = x0[:, np.newaxis] + np.arange(w)
+
+    result = np.empty((len(points), image.shape[-1]))
+    step = max(1, CHUNK_PIXELS // (w * h))
+    for i in range(0, len(points), step):
+        r = rows[i:i + step, :, np.newaxis]
+        c = cols[i:i + step, np.newaxis, :]
+        result[i:i + step] = np.mean(image[r, c], axis=(1, 2), dtype=np.float64)
+
+    # グレースケールは3チャンネルに, アルファは捨てる
+    if result.shape[-1] == 1:
+        result = np.repeat(result, 3, axis=-1)
+
+    return result[:, :3]
+
+def sample_grid(image, rows, cols, quad, size=0.5):
+    # quad = 四隅 (左上, 右上, 右下, 左下) の (x, y) -> (rows * cols, 3)
+    return sample(image, centres(rows, cols, quad), window(rows, cols, quad, size))
+
+def read_checker(path, rows, cols, quad, size=0.5, shape=None, dtype=np.float32, offset=0):
+    image = open_image(path, shape, dtype, offset)
+    if image is None:
+        return None
+
+    return sample_grid(image, rows, cols, quad, size)
@@ -0,0 +1,110 @@
+import logging
+import os
+import numpy as np
+
+import ty_camera
+import ty_registry
+
+colour = ty_registry.colour
+
+logger = logging.getLogger(__name__)
+
+# チェッカーから求めた補正を 3D LUT (.cube / .spi3d) に焼く
+#
+# 格子は CHUNK 点ずつ評価して書き出すので 129^3 でもメモリは一定
+FORMATS = ['cube', 'spi3d']
+
+# 一度に評価して書き出す格子点の数
+CHUNK = 256 * 1024
+
+#=================================#
+# Correction
+#=================================#
+def correction_matrix(source, target):
+    # source (N, 3) -> target (N, 3) の 3x3 (linear RGB)
+    return ty_camera.fit(source, target)
+
+def transform(matrix, colorspace=None, encode=True):
+    # 入力を colorspace の cctf で linear に戻して 3x3, また cctf で戻す
+    # colorspace = None なら linear のまま
+    matrix = np.asarray(matrix, dtype=np.float64)
+
+    def func(rgb):
+        if colorspace is not None and encode:
+            rgb = colour.RGB_COLOURSPACES[colorspace].cctf_decoding(rgb)
+
+        rgb = np.matmul(rgb, np.transpose(matrix))
+
+        if colorspace is not None and encode:
+            rgb = colour.RGB_COLOURSPACES[colorspace].cctf_encoding(np.clip(rgb, 0, 1))
+
+        return rgb
+
+    return func
+
+#=================================#
+# Lattice
+#=================================#
+def lattice(size, start, stop, order='rgb', domain=(0.0, 1.0)):
+    # 格子点 [start, stop) の (M, 3) RGB
+    # order = 'rgb' なら R が一番速く回る (.cube), 'bgr' なら B (.spi3d)
+    k = np.arange(start, stop)
+    i0 = k % size
+    i1 = (k // size) % size
+    i2 = k // (size * size)
+
+    if order == 'rgb':
+        index = np.stack([i0, i1, i2], axis=-1)
+    else:
+        index = np.stack([i2, i1, i0], axis=-1)
+
+    low, high = domain
+    return index, low + index * ((high - low) / (size - 1))
+
+def chunks(size, order='rgb', domain=(0.0, 1.0), chunk=CHUNK):
+    total = size ** 3
+    for start in range(0, total, chunk):
+        yield lattice(size, start, min(start + chunk, total), order, domain)
+
+#=================================#
+# Write
+#=================================#
+def write_rows(f, values, row):
+    # np.savetxt より速いように1チャンク分をまとめて文字列にする
+    f.write((row * len(values)) % tuple(values.ravel().tolist()))
+
+def write_cube(f, func, size, domain, title, chunk):
+    if title:
+        f.write(f'TITLE "{title}"\n')
+    f.write(f'LUT_3D_SIZE {size}\n')
+    f.write(f'DOMAIN_MIN {domain[0]:g} {domain[0]:g} {domain[0]:g}\n')
+    f.write(f'DOMAIN_MAX {domain[1]:g} {domain[1]:g} {domain[1]:g}\n')
+
+    for _, rgb in chunks(size, 'rgb', domain, chunk):
+        write_rows(f, func(rgb), '%.6f %.6f %.6f\n')
+
+def write_spi3d(f, func, size, domain, title, chunk):
+    f.write('SPILUT 1.0\n')
+    f.write('3 3\n')
+    f.write(f'{size} {size} {size}\n')
+
+    for index, rgb in chunks(size, 'bgr', domain, chunk):
+        values = np.hstack([index, func(rgb)])
+        write_rows(f, values, '%d %d %d %.6f %.6f %.6f\n')
+
+def bake(path, func, size=33, fmt=None, domain=(0.0, 1.0), title=None, chunk=CHUNK):
+    # func : (M, 3) -> (M, 3)
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    if not fmt in FORMATS:
+        logger.warning(f'"{fmt}" is not supported.')
+        return None
+
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8', newline='\n') as f:
+        if fmt == 'cube':
+            write_cube(f, func, size, domain, title, chunk)
+        else:
+            write_spi3d(f, func, size, domain, title, chunk)
+    os.replace(tmp, path)
+
+    return path
@@ -0,0 +1,161 @@
+import importlib
+import importlib.util
+import json
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 3
+INDEX_FILE = 'registry.json'
+
+#=================================#
+# Lazy Import
+#=================================#
+class LazyModule:
+    # 最初に属性を参照した時に import する
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        return getattr(self.module(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f'<LazyModule {self._name} ({state})>'
+
+    def module(self):
+        if self._module is None:
+            start = time.perf_counter()
+            self._module = importlib.import_module(self._name)
+            logger.debug(f'import {self._name} = {time.perf_counter() - start:.3f} sec')
+
+        return self._module
+
+    def is_loaded(self):
+        # 他のところで import 済みでも True
+        return self._module is not None or self._name in sys.modules
+
+def lazy_import(name):
+    return LazyModule(name)
+
+colour = lazy_import('colour')
+
+#=================================#
+# Name Index
+#=================================#
+def cache_dir():
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+
+    return os.path.join(root, 'ty_colorchecker')
+
+def index_path():
+    return os.path.join(cache_dir(), INDEX_FILE)
+
+def stamp():
+    # colour を import せずにインストール状態を確認する
+    spec = importlib.util.find_spec('colour')
+    origin = spec.origin if spec is not None else ''
+    mtime = os.stat(origin).st_mtime if origin else 0.0
+
+    return {
+        'index_version': INDEX_VERSION,
+        'colour': origin,
+        'mtime': mtime,
+    }
+
+def registry(kind):
+    # colour 本体の辞書
+    return {
+        'checkers': lambda: colour.characterisation.SDS_COLOURCHECKERS,
+        'cmfs': lambda: colour.MSDS_CMFS,
+        'illuminants': lambda: colour.SDS_ILLUMINANTS,
+        'colorspaces': lambda: colour.RGB_COLOURSPACES,
+        'references': lambda: colour.CCS_COLOURCHECKERS,
+        'cameras': lambda: colour.MSDS_CAMERA_SENSITIVITIES,
+    }[kind]()
+
+KINDS = ['checkers', 'cmfs', 'illuminants', 'colorspaces', 'references', 'cameras']
+
+def build_index():
+    logger.info('> Build Registry Index')
+
+    return { kind: sorted(registry(kind).keys()) for kind in KINDS }
+
+def load_index(path=None):
+    path = path or index_path()
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f'Failed to read "{path}": {e}')
+        return None
+
+    if data.get('stamp') != stamp():
+        logger.info('> Registry Index is out of date.')
+        return None
+
+    return data.get('names')
+
+def save_index(names, path=None):
+    path = path or index_path()
+    data = {'stamp': stamp(), 'names': names}
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=1, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f'Failed to write "{path}": {e}')
+
+_INDEX = None
+
+def index():
+    global _INDEX
+
+    if _INDEX is None:
+        names = load_index()
+        if names is None:
+            names = build_index()
+            save_index(names)
+
+        _INDEX = names
+
+    return _INDEX
+
+def names(kind):
+    result = list(index()[kind])
+
+    # 実行中に登録されたもの (colour.SDS_ILLUMINANTS['mine'] = sd) は後ろに足す
+    # colour を import していなければ増えているはずがないので見ない
+    if colour.is_loaded():
+        known = set(result)
+        result.extend(sorted(name for name in registry(kind).keys() if not name in known))
+
+    return result
+
+def rebuild():
+    global _INDEX
+
+    _INDEX = build_index()
+    save_index(_INDEX)
+
+    return _INDEX
+
+#=================================#
+# Startup Time
+#=================================#
+_START = time.perf_counter()
+
+def startup_time():
+    # このモジュールを import してからの経過時間
+    return time.perf_counter() - _START
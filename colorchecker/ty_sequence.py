@@ -0,0 +1,178 @@
+import argparse
+import collections
+import concurrent.futures
+import json
+import logging
+import os
+import sys
+import time
+import numpy as np
+
+import ty_colorimetry
+import ty_image
+import ty_registry
+
+colour = ty_registry.colour
+
+logger = logging.getLogger(__name__)
+
+# 連番画像のチェッカーを1フレームずつ ΔE 評価する
+#
+# フレームは別スレッドで先読みして、結果は generator で1フレームずつ返す
+# 同時に持つのは depth フレーム分のパッチ値だけなので、何千フレームでもメモリは一定
+EXTENSIONS = ['.npy', '.exr', '.dpx', '.png'] + ty_image.RAW_EXTENSIONS + ty_image.TIFF_EXTENSIONS
+
+#=================================#
+# Frames
+#=================================#
+def frames(directory, extensions=EXTENSIONS):
+    # 名前順のフレームのパス
+    names = sorted(os.listdir(directory))
+    for name in names:
+        if os.path.splitext(name)[1].lower() in extensions:
+            yield os.path.join(directory, name)
+
+def read_ahead(paths, func, depth=4, workers=2):
+    # func(path) を workers スレッドで先読み, 先に進むのは depth フレームまで
+    # 順番はフレーム順のまま (path, result) を返す
+    pending = collections.deque()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    try:
+        for path in paths:
+            pending.append((path, executor.submit(func, path)))
+            if len(pending) >= depth:
+                path, future = pending.popleft()
+                yield path, future.result()
+
+        while pending:
+            path, future = pending.popleft()
+            yield path, future.result()
+    finally:
+        # 途中で止めた時は読みかけを捨てる
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+#=================================#
+# Analyse
+#=================================#
+def analyse(paths, reference_xyz, reference_whitepoint, colorspace, rows, cols, quad,
+            size=0.5, method='CIE 2000', adaptation=None, names=None,
+            depth=4, workers=2, image_shape=None, dtype=np.float32, offset=0):
+    # reference_xyz (N, 3) : render() した XYZ, 画像は colorspace の linear RGB
+    whitepoint = ty_colorimetry.colorspace_whitepoint(colorspace)
+
+    def load(path):
+        # 壊れたフレームで全体を止めない, エラーはそのフレームの結果にする
+        try:
+            return ty_image.read_checker(
+                path, rows, cols, quad, size, image_shape, dtype, offset), None
+        except Exception as e:
+            logger.warning(f'Failed to read "{path}": {e}')
+            return None, str(e)
+
+    for index, (path, (rgb, error)) in enumerate(read_ahead(paths, load, depth, workers)):
+        if rgb is None:
+            yield {'index': index, 'path': path, 'error': error or 'Failed to read.'}
+            continue
+
+        xyz = ty_colorimetry.RGB_to_XYZ(rgb, colorspace)
+        k = ty_colorimetry.exposure(xyz, reference_xyz)
+
+        difs = ty_colorimetry.delta_E(
+            reference_xyz, reference_whitepoint, xyz * k, whitepoint, method, adaptation)
+
+        yield {
+            'index': index,
+            'path': path,
+            'exposure': float(k),
+            'rgb': rgb,
+            'delta_E': difs,
+            'summary': ty_colorimetry.summary(difs, names),
+        }
+
+#=================================#
+# Write
+#=================================#
+def to_json(result):
+    # ndarray / numpy の数値を json にできる形へ
+    if isinstance(result, dict):
+        return { key: to_json(value) for key, value in result.items() }
+    if isinstance(result, (np.ndarray, np.generic)):
+        return result.tolist()
+
+    return result
+
+#=================================#
+# Run
+#=================================#
+def main(argv=None):
+    import ty_colorchecker_v1
+
+    parser = argparse.ArgumentParser(
+        description='Streaming colour checker analysis of a frame sequence.')
+    parser.add_argument('directory', help='frame directory')
+    parser.add_argument('-c', '--checker', default='ISO 17321-1')
+    parser.add_argument('-i', '--illuminant', default='D65')
+    parser.add_argument('--cmfs', default='CIE 1931 2 Degree Standard Observer')
+    parser.add_argument('-s', '--colorspace', default='ACES2065-1',
+                        help='colorspace of the linear frames')
+    parser.add_argument('-g', '--grid', type=int, nargs=2, default=[4, 6],
+                        metavar=('ROWS', 'COLS'))
+    parser.add_argument('-q', '--quad', type=float, nargs=8, required=True,
+                        metavar='XY', help='corners (top left, top right, bottom right, bottom left)')
+    parser.add_argument('--size', type=float, default=0.5, help='window size per patch')
+    parser.add_argument('--method', default='CIE 2000')
+    parser.add_argument('--adaptation', default=None)
+    parser.add_argument('--image-shape', type=int, nargs='+', default=None,
+                        help='height width channels for raw frames')
+    parser.add_argument('--dtype', default='float32', help='dtype for raw frames')
+    parser.add_argument('-d', '--depth', type=int, default=4, help='frames in flight')
+    parser.add_argument('-j', '--workers', type=int, default=2, help='read threads')
+    parser.add_argument('-o', '--output', default=None, help='write results (json lines)')
+    args = parser.parse_args(argv)
+
+    cc = ty_colorchecker_v1.TyColorChecker_v1(ty_colorchecker_v1.logger)
+    cc.set_shape((380, 780, 5))
+    cc.set(args.checker)
+    cc.set_cmf(args.cmfs)
+    cc.set_illuminant(args.illuminant)
+    cc.render()
+
+    checker = cc.get()
+    rows, cols = args.grid
+    if rows * cols != checker.count():
+        logger.warning(f'{rows} x {cols} does not match {checker.count()} patches.')
+        return 1
+
+    results = analyse(
+        frames(args.directory), checker.xyzs(), checker.whitepoint(), args.colorspace,
+        rows, cols, np.reshape(args.quad, (4, 2)), args.size, args.method, args.adaptation,
+        None, args.depth, args.workers, args.image_shape, np.dtype(args.dtype))
+
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    start = time.perf_counter()
+
+    try:
+        for result in results:
+            result.pop('rgb', None)
+            output.write(json.dumps(to_json(result), ensure_ascii=False) + '\n')
+            output.flush()
+
+            if 'summary' in result:
+                logger.info(
+                    f'[{result["index"]}] {os.path.basename(result["path"])} '
+                    f'mean = {float(result["summary"]["mean"]):.3f}')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    logger.info(f'> Done = {time.perf_counter() - start:.3f} sec')
+
+    return 0
+
+if __name__ == '__main__':
+    logging.basicConfig(level = logging.INFO)
+
+    sys.exit(main())
@@ -0,0 +1,412 @@
+import argparse
+import json
+import logging
+import math
+import numbers
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+import numpy as np
+
+import ty_cache
+import ty_colorchecker_v2
+import ty_registry
+import ty_sequence
+import ty_spectral
+
+colour = ty_registry.colour
+
+logger = logging.getLogger(__name__)
+
+# TyColorChecker_v2 を立ち上げたままにして、パイプラインのツールから何度も呼ぶ
+#
+# 1行1リクエストの json lines (stdin / Unix socket / localhost の TCP)
+# {"id": 1, "op": "render", "checker": "ISO 17321-1", "illuminant": "A", "colorspace": "ACEScg"}
+# {"id": 2, "op": "evaluate", "illuminant": "D65", "reference": "ColorChecker24 - After November 2014"}
+# {"op": "names", "kind": "illuminants"}
+# {"op": "stats"}
+# [{...}, {...}]   配列はまとめて処理して、同じ順番の配列で返す
+#
+# 返事も1行 {"id": 1, "ok": true, "result": {...}, "time": ms}
+# 失敗した時は {"id": 1, "ok": false, "error": "..."}
+#
+# colour の import, Checker, 揃えた CMFs, 結果はプロセスが生きている間ずっと持つ
+DEFAULT_REQUEST = {
+    'checker': 'ISO 17321-1',
+    'illuminant': 'D65',
+    'cmfs': 'CIE 1931 2 Degree Standard Observer',
+    'colorspace': 'sRGB',
+    'adaptation': None,
+    'shape': None,
+}
+
+OPS = ['render', 'evaluate', 'names', 'stats', 'ping']
+
+# shape を省略した時, core の今の shape は前のリクエストで変わるので使わない
+SHAPE = (380, 780, 5)
+
+HOST = '127.0.0.1'
+
+#=================================#
+# Service
+#=================================#
+class Service:
+    def __init__(self, core=None):
+        self.core = core or ty_colorchecker_v2.TyColorChecker_v2()
+
+        # core は1つなので、どの接続から来ても1つずつ処理する
+        self._lock = threading.Lock()
+
+        # render のキー -> (3, N, 3) xyz / linear / rgb
+        self._results = ty_cache.ArrayCache(max_bytes=64 * 1024 * 1024)
+        self._whitepoints = ty_cache.ArrayCache(max_bytes=1024 * 1024)
+        self._names = {}
+        self._requests = 0
+        self._shape = SHAPE
+
+    #=================================#
+    # Set / Get
+    #=================================#
+    def set_shape(self, shape):
+        # shape を省略したリクエストで使う
+        self._shape = tuple(shape)
+
+    def shape(self):
+        return self._shape
+
+    #=================================#
+    # Params
+    #=================================#
+    def params(self, request):
+        params = dict(DEFAULT_REQUEST)
+        params.update({key: request[key] for key in DEFAULT_REQUEST if key in request})
+        if params['shape'] is None:
+            params['shape'] = self._shape
+
+        return params
+
+    def check_shape(self, shape):
+        # (start, end, interval) の有限な数, start < end, interval > 0
+        if not isinstance(shape, (list, tuple)) or len(shape) != 3:
+            return False
+
+        for value in shape:
+            if isinstance(value, bool) or not isinstance(value, numbers.Real):
+                return False
+            if not math.isfinite(value):
+                return False
+
+        start, end, interval = shape
+        return start < end and interval > 0
+
+    def check(self, params):
+        # 名前が無い時はエラーの文字列
+        for key, names in [
+            ('checker', self.core.checkers()),
+            ('illuminant', self.core.illuminants()),
+            ('cmfs', self.core.cmfs()),
+        ]:
+            if not params[key] in names:
+                return f'"{params[key]}" is not found.'
+
+        colorspace = params['colorspace']
+        if colorspace != 'Spectrum' and not colorspace in self.core.colorspaces():
+            return f'"{colorspace}" is not found.'
+
+        adaptation = params['adaptation']
+        if adaptation is not None and not adaptation in self.core.adaptations():
+            return f'"{adaptation}" is not found.'
+
+        if not self.check_shape(params['shape']):
+            return f'Invalid shape {json.dumps(params["shape"])}.'
+        params['shape'] = tuple(params['shape'])
+
+        return None
+
+    def key(self, params):
+        return tuple(params[key] for key in DEFAULT_REQUEST)
+
+    def select(self, params):
+        # 変わった所だけ Scene のキャッシュが捨てられる
+        self.core.set_shape(params['shape'])
+        self.core.set_checker(params['checker'])
+        self.core.set_cmfs(params['cmfs'])
+        self.core.set_illuminant(params['illuminant'])
+        self.core.set_colorspace(params['colorspace'])
+        self.core.set_adaptation(params['adaptation'])
+
+    def compute(self, params, func):
+        # 途中で失敗したら shape を戻して、次のリクエストに持ち越さない
+        shape = self.core.shape()
+        try:
+            self.select(params)
+            return func()
+        except Exception:
+            self.core.set_shape(shape)
+            raise
+
+    #=================================#
+    # Ops
+    #=================================#
+    def render(self, params):
+        def func():
+            result = self.compute(params, self.core.result)
+            self._names[params['checker']] = result['names']
+            return np.stack([result['xyz'], result['linear'], result['rgb']])
+
+        def whitepoint():
+            return self.compute(params, self.core.result)['whitepoint']
+
+        values = self._results.get(self.key(params), func)
+        key = (params['illuminant'], params['cmfs'], params['shape'])
+
+        return {
+            'names': self._names[params['checker']],
+            'xyz': values[0],
+            'linear': values[1],
+            'rgb': values[2],
+            'whitepoint': self._whitepoints.get(key, whitepoint),
+        }
+
+    def evaluate(self, params, request):
+        return self.compute(params, lambda: self.core.evaluate(
+            request.get('reference', 'ColorChecker24 - After November 2014'),
+            request.get('method', 'CIE 2000'),
+            request.get('adaptation')))
+
+    def stats(self):
+        return {
+            'requests': self._requests,
+            'results': self._results.stats(),
+            'spectral': ty_spectral.CACHE.stats(),
+            'disk': ty_spectral.RESULTS.stats(),
+        }
+
+    def run(self, request):
+        op = request.get('op', 'render')
+        if not op in OPS:
+            return None, f'"{op}" is not supported.'
+
+        if op == 'ping':
+            return 'pong', None
+        if op == 'stats':
+            return self.stats(), None
+        if op == 'names':
+            kind = request.get('kind', 'checkers')
+            if not kind in ['colorspaces', 'illuminants', 'cmfs', 'checkers', 'references']:
+                return None, f'"{kind}" is not found.'
+            return getattr(self.core, kind)(), None
+
+        params = self.params(request)
+        error = self.check(params)
+        if error is not None:
+            return None, error
+
+        if op == 'render':
+            return self.render(params), None
+
+        result = self.evaluate(params, request)
+        if result is None:
+            return None, 'Failed to evaluate.'
+
+        return result, None
+
+    def handle(self, request):
+        start = time.perf_counter()
+
+        if not isinstance(request, dict):
+            result, error = None, 'Request must be an object.'
+        else:
+            with self._lock:
+                self._requests += 1
+                try:
+                    result, error = self.run(request)
+                except Exception as e:
+                    logger.exception(f'Failed to run {request}')
+                    result, error = None, f'{type(e).__name__}: {e}'
+
+        response = {'id': request.get('id') if isinstance(request, dict) else None}
+        if error is None:
+            response.update({'ok': True, 'result': result})
+        else:
+            response.update({'ok': False, 'error': error})
+        response['time'] = (time.perf_counter() - start) * 1000
+
+        return response
+
+    def handle_batch(self, requests):
+        # 同じ checker / cmfs / shape を続けて処理して Scene のキャッシュを使い回す
+        # 返す順番はリクエストの順番のまま
+        def order(i):
+            request = requests[i]
+            if not isinstance(request, dict):
+                return ('', )
+            return tuple(str(request.get(key, '')) for key in ['checker', 'cmfs', 'shape', 'illuminant'])
+
+        responses = [None] * len(requests)
+        for i in sorted(range(len(requests)), key=order):
+            responses[i] = self.handle(requests[i])
+
+        return responses
+
+    def handle_line(self, line):
+        # 1行 -> 返事の1行 (改行なし), 空行は None
+        line = line.strip()
+        if not line:
+            return None
+
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            response = {'id': None, 'ok': False, 'error': f'Invalid json: {e}'}
+        else:
+            if isinstance(request, list):
+                response = [ty_sequence.to_json(r) for r in self.handle_batch(request)]
+            else:
+                response = ty_sequence.to_json(self.handle(request))
+
+        return json.dumps(response, ensure_ascii=False)
+
+    #=================================#
+    # Warm
+    #=================================#
+    def warm(self, checkers=None):
+        # colour の import と Checker を先に済ませておく
+        start = time.perf_counter()
+
+        ty_registry.colour.module()
+        for name in checkers or [DEFAULT_REQUEST['checker']]:
+            self.handle({'op': 'render', 'checker': name})
+
+        logger.info(f'> Warm = {time.perf_counter() - start:.3f} sec')
+
+#=================================#
+# Serve
+#=================================#
+def serve_stream(service, input, output):
+    for line in input:
+        response = service.handle_line(line)
+        if response is None:
+            continue
+
+        output.write(response + '\n')
+        output.flush()
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            response = self.server.service.handle_line(line.decode('utf-8'))
+            if response is None:
+                continue
+
+            self.wfile.write((response + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+class TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+def server(service, unix=None, port=None, host=HOST):
+    if unix is not None:
+        if os.path.exists(unix):
+            os.remove(unix)
+        result = UnixServer(unix, Handler)
+    else:
+        result = TCPServer((host, port), Handler)
+
+    result.service = service
+
+    return result
+
+#=================================#
+# Client
+#=================================#
+class Client:
+    # 接続は開いたまま使い回す
+    def __init__(self, unix=None, port=None, host=HOST, timeout=None):
+        if unix is not None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(unix)
+        else:
+            self._socket = socket.create_connection((host, port))
+        self._socket.settimeout(timeout)
+        self._file = self._socket.makefile('rwb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def request(self, payload):
+        # dict か dict の list
+        self._file.write((json.dumps(payload) + '\n').encode('utf-8'))
+        self._file.flush()
+
+        line = self._file.readline()
+        if not line:
+            logger.warning('Connection closed.')
+            return None
+
+        return json.loads(line)
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+#=================================#
+# Run
+#=================================#
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Warm colour checker render service (json lines).')
+    parser.add_argument('--unix', default=None, help='listen on a unix socket')
+    parser.add_argument('--port', type=int, default=None, help='listen on localhost')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--shape', type=int, nargs=3, default=None,
+                        metavar=('START', 'END', 'INTERVAL'))
+    parser.add_argument('--warm', nargs='*', default=None,
+                        help='checkers to render on startup (default: ISO 17321-1)')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        ty_colorchecker_v2.logger.setLevel(logging.WARNING)
+
+    service = Service()
+    if args.shape is not None:
+        service.set_shape(args.shape)
+    service.warm(args.warm)
+
+    # どちらも無ければ stdin / stdout
+    if args.unix is None and args.port is None:
+        serve_stream(service, sys.stdin, sys.stdout)
+        return 0
+
+    # kill された時も finally で socket を消す
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+
+    with server(service, args.unix, args.port, args.host) as s:
+        logger.info(f'> Listen = {args.unix or (args.host, args.port)}')
+        try:
+            s.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if args.unix is not None and os.path.exists(args.unix):
+                os.remove(args.unix)
+
+    return 0
+
+if __name__ == '__main__':
+    logging.basicConfig(level = logging.INFO)
+
+    sys.exit(main())
@@ -0,0 +1,242 @@
+import logging
+import numpy as np
+
+import ty_cache
+import ty_colorimetry
+import ty_registry
+from ty_stats import STATS
+
+colour = ty_registry.colour
+
+logger = logging.getLogger(__name__)
+
+#=================================#
+# Cache
+#=================================#
+# (kind, name, start, end, interval) -> np.ndarray
+CACHE = ty_cache.ArrayCache()
+
+# レンダリング結果 (SD / 光源 / CMFs / shape の中身のハッシュ) -> .npy
+RESULTS = ty_cache.DiskCache('results')
+
+# auto_shape の結果 (start, end, interval, ΔE max)
+SHAPES = ty_cache.DiskCache('shapes', max_bytes=1024 * 1024)
+
+#=================================#
+# Shape
+#=================================#
+def spectral_shape(shape):
+    if isinstance(shape, colour.SpectralShape):
+        return shape
+
+    return colour.SpectralShape(shape[0], shape[1], shape[2])
+
+def shape_key(shape):
+    shape = spectral_shape(shape)
+    return (float(shape.start), float(shape.end), float(shape.interval))
+
+def sd_key(sd):
+    # 名前ではなく中身で区別する (同じ名前の別の測定データが同じ重みを使わないように)
+    # 毎回ハッシュするので、中身をその場で書き換えてもディスクのキーと食い違わない
+    return f'{sd.name}:{ty_cache.digest(sd)}'
+
+#=================================#
+# Align
+#=================================#
+def interpolation_matrix(domain, shape):
+    # 補間 / 外挿は値に対して線形なので、単位行列を1回 align して
+    # (λ, λ_src) の行列にしておけば何パッチでも行列積1回で済む
+    def func():
+        basis = colour.MultiSpectralDistributions(np.identity(len(domain)), domain)
+        basis.align(spectral_shape(shape))
+        return np.array(basis.values, dtype=np.float64)
+
+    # 端と点数が同じでも間隔が違う (不等間隔の測定データなど) と行列も違う
+    domain = np.asarray(domain, dtype=np.float64)
+    key = ('interpolation', ty_cache.digest(domain)) + shape_key(shape)
+    return CACHE.get(key, func)
+
+def align_sds(sds, shape):
+    # sds = { name: SpectralDistribution } -> (N, λ)
+    shape = spectral_shape(shape)
+    sds = list(sds.values())
+
+    with STATS.stage('align'):
+        domain = sds[0].wavelengths
+        if all(np.array_equal(sd.wavelengths, domain) for sd in sds):
+            data = np.array([sd.values for sd in sds], dtype=np.float64)
+            result = np.matmul(data, np.transpose(interpolation_matrix(domain, shape)))
+        else:
+            result = np.array([sd.copy().align(shape).values for sd in sds])
+
+    return np.ascontiguousarray(result, dtype=np.float64)
+
+def align_cmfs(cmfs, shape):
+    def func():
+        with STATS.stage('align'):
+            result = cmfs.copy().align(spectral_shape(shape)).values
+        return np.array(result, dtype=np.float64)
+
+    key = ('cmfs', sd_key(cmfs)) + shape_key(shape)
+    return CACHE.get(key, func)
+
+def align_illuminant(illuminant, shape):
+    def func():
+        with STATS.stage('align'):
+            result = illuminant.copy().align(spectral_shape(shape)).values
+        return np.array(result, dtype=np.float64)
+
+    key = ('illuminant', sd_key(illuminant)) + shape_key(shape)
+    return CACHE.get(key, func)
+
+#=================================#
+# Weights
+#=================================#
+# この間隔は 1nm の CMFs / 光源から ASTM E2022 の重み係数を作る (ASTM E308 と同じ)
+# 単純に間引くと 10nm で FL2 などが 1nm から ΔE 3 以上ずれる
+ASTM_INTERVALS = (10, 20)
+
+def weighting(shape):
+    # 重みの作り方, ディスクキャッシュのキーにも使う
+    if spectral_shape(shape).interval in ASTM_INTERVALS:
+        return 'ASTM E2022'
+
+    return 'Integration'
+
+def weights_ASTME2022(cmfs, illuminant, shape):
+    # (λ, 3) : k = 1 の重み係数
+    one = colour.SpectralShape(shape.start, shape.end, 1)
+    c = cmfs.copy().align(one)
+    s = colour.sd_ones(one) if illuminant is None else illuminant.copy().align(one)
+
+    result = colour.colorimetry.tristimulus_weighting_factors_ASTME2022(c, s, shape, k=1)
+    return np.array(result, dtype=np.float64)
+
+def normalisation(cmfs, illuminant, shape):
+    # k = 1 / Σ S(λ)ȳ(λ)
+    return 1.0 / _weights(cmfs, illuminant, shape)[-1, 1]
+
+def whitepoint(cmfs, illuminant, shape):
+    # 完全拡散反射面の XYZ (Y = 1.0)
+    total = _weights(cmfs, illuminant, shape)[-1]
+    return total / total[1]
+
+def weights(cmfs, illuminant, shape):
+    # (λ, 3) : k * S(λ) * cmfs(λ)
+    # illuminant = None は等エネルギー(E)
+    return _weights(cmfs, illuminant, shape)[:-1]
+
+def _weights(cmfs, illuminant, shape):
+    # 最終行に Σ S(λ)cmfs(λ) を持たせて k と一緒にキャッシュする
+    def func():
+        if weighting(shape) == 'ASTM E2022':
+            with STATS.stage('align'):
+                result = weights_ASTME2022(cmfs, illuminant, spectral_shape(shape))
+        else:
+            c = align_cmfs(cmfs, shape)
+
+            if illuminant is None:
+                s = np.ones(len(c))
+            else:
+                s = align_illuminant(illuminant, shape)
+
+            result = s[:, np.newaxis] * c
+
+        total = np.sum(result, axis=0)
+        result /= total[1]
+
+        return np.vstack([result, total])
+
+    name = 'E' if illuminant is None else sd_key(illuminant)
+    key = ('weights', sd_key(cmfs), name) + shape_key(shape)
+    return CACHE.get(key, func)
+
+#=================================#
+# Integrate
+#=================================#
+def integrate(values, weights):
+    # (..., λ) @ (λ, 3) -> (..., 3), Y = 1.0 for R(λ) = 1
+    with STATS.stage('integrate'):
+        return np.matmul(values, weights)
+
+def render(sds, cmfs, illuminant, shape, values=None):
+    # 同じ中身なら前回の結果をディスクから読む
+    # values : 揃えた (N, λ) を返す関数 (Checker.values のキャッシュを使う時)
+    def func():
+        v = values() if values is not None else align_sds(sds, shape)
+        return integrate(v, weights(cmfs, illuminant, shape))
+
+    key = ('xyz', weighting(shape), sds, cmfs, illuminant, shape_key(shape))
+    return RESULTS.get(key, func)
+
+#=================================#
+# Sweep
+#=================================#
+def sweep(checkers, illuminants, cmfs, shape):
+    # checkers    = [ { name: SpectralDistribution }, ... ]
+    # illuminants = [ SpectralDistribution, ... ]
+    # cmfs        = [ MultiSpectralDistributions, ... ]
+    # -> (checker, illuminant, observer, patch, 3)
+    # パッチ数が違うチェッカーは NaN で埋める
+    values = [align_sds(sds, shape) for sds in checkers]
+    n = max(len(v) for v in values)
+
+    r = np.full((len(values), n, values[0].shape[-1]), np.nan)
+    for i, v in enumerate(values):
+        r[i, :len(v)] = v
+
+    # (illuminant, observer, λ, 3)
+    w = np.array([[weights(cmf, ilm, shape) for cmf in cmfs] for ilm in illuminants])
+
+    with STATS.stage('integrate'):
+        return np.einsum('cnl,iolk->cionk', r, w, optimize=True)
+
+def sweep_whitepoints(illuminants, cmfs, shape):
+    # -> (illuminant, observer, 3)
+    result = [
+        [whitepoint(cmf, ilm, shape) for cmf in cmfs]
+        for ilm in illuminants
+    ]
+
+    return np.array(result)
+
+#=================================#
+# Auto Shape
+#=================================#
+# 粗い順に試す, どれも (end - start) を割り切れること
+INTERVALS = [20, 10, 5, 4, 2, 1]
+
+def shape_error(sds, cmfs, illuminant, shape, reference, method='CIE 2000'):
+    # reference の shape (1nm) との ΔE -> (N, )
+    def lab(s):
+        xyz = render(sds, cmfs, illuminant, s)
+        return xyz, whitepoint(cmfs, illuminant, s)
+
+    xyz, white = lab(shape)
+    ref_xyz, ref_white = lab(reference)
+
+    return ty_colorimetry.delta_E(xyz, white, ref_xyz, ref_white, method)
+
+def auto_shape(sds, cmfs, illuminant, tolerance=0.1, start=380, end=780,
+               intervals=INTERVALS, method='CIE 2000'):
+    # 全パッチが 1nm の結果から tolerance 以内に収まる一番粗い shape
+    # -> ((start, end, interval), ΔE max), 組み合わせごとにディスクにキャッシュ
+    reference = (start, end, 1)
+
+    def func():
+        for interval in intervals:
+            if (end - start) % interval:
+                continue
+
+            shape = (start, end, interval)
+            error = float(np.max(shape_error(sds, cmfs, illuminant, shape, reference, method)))
+            if error <= tolerance:
+                break
+
+        return np.array(shape + (error, ), dtype=np.float64)
+
+    key = ('auto_shape', ASTM_INTERVALS, sds, cmfs, illuminant, tolerance, start, end,
+           tuple(intervals), method)
+    result = SHAPES.get(key, func)
+
+    return tuple(float(value) for value in result[:3]), float(result[3])
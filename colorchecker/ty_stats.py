@@ -0,0 +1,96 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+# ステージごとの時間計測
+#
+# with ty_stats.STATS.stage('integrate'):
+#     ...
+#
+# 無効の時は何もしない context を返すだけ
+STAGES = ['ingest', 'align', 'integrate', 'convert', 'evaluate', 'fit', 'rasterise']
+
+_NULL = contextlib.nullcontext()
+
+class _Stage:
+    __slots__ = ('_stats', '_name', '_start')
+
+    def __init__(self, stats, name):
+        self._stats = stats
+        self._name = name
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self._stats.record(self._name, time.perf_counter() - self._start)
+        return False
+
+class Stats:
+    def __init__(self, enabled=False):
+        self._enabled = enabled
+        self._data = {}
+        self._lock = threading.Lock()
+
+    #=================================#
+    # Set / Get
+    #=================================#
+    def enable(self):
+        self._enabled = True
+
+    def disable(self):
+        self._enabled = False
+
+    def is_enabled(self):
+        return self._enabled
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._data)
+
+        result = {}
+        for name, (count, total, low, high) in data.items():
+            result[name] = {
+                'count': count,
+                'total': total,
+                'mean': total / count,
+                'min': low,
+                'max': high,
+            }
+
+        return result
+
+    #=================================#
+    # Methods
+    #=================================#
+    def stage(self, name):
+        if not self._enabled:
+            return _NULL
+
+        return _Stage(self, name)
+
+    def record(self, name, seconds):
+        with self._lock:
+            count, total, low, high = self._data.get(name, (0, 0.0, seconds, seconds))
+            self._data[name] = (
+                count + 1, total + seconds, min(low, seconds), max(high, seconds))
+
+    def reset(self):
+        with self._lock:
+            self._data = {}
+
+    def to_json(self, path=None):
+        result = json.dumps(self.stats(), indent=4)
+
+        if path is not None:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(result)
+
+        return result
+
+# TY_COLORCHECKER_STATS=1 で最初から有効
+STATS = Stats(enabled=os.environ.get('TY_COLORCHECKER_STATS', '') not in ('', '0'))
@@ -0,0 +1,315 @@
+import argparse
+import concurrent.futures
+import csv
+import json
+import logging
+import os
+import sys
+import time
+import numpy as np
+
+import ty_camera
+import ty_colorimetry
+import ty_registry
+import ty_spectral
+import ty_sweepfile
+
+colour = ty_registry.colour
+
+logger = logging.getLogger(__name__)
+
+# PySide2 なしで動くバッチ用
+#
+# spec.json
+# {
+#     "checkers": ["ISO 17321-1"],
+#     "illuminants": ["D65", "A", "FL2"],
+#     "cmfs": ["CIE 1931 2 Degree Standard Observer"],
+#     "colorspaces": ["sRGB", "ACEScg"],
+#     "shape": [380, 780, 5],
+#     "adaptation": "CAT02",
+#     "reference": "ColorChecker24 - After November 2014",
+#     "method": "CIE 2000",
+#     "cameras": ["Nikon 5100 (NPL)"],
+#     "idt_colorspace": "ACES2065-1",
+#     "chunk": 8
+# }
+# cameras を指定したら camera x illuminant ごとの IDT 行列も計算する (npz のみ)
+# idt_colorspace = null なら camera RGB -> XYZ, 目標値は cmfs の先頭で計算
+DEFAULT_SPEC = {
+    'checkers': [],
+    'illuminants': [],
+    'cmfs': ['CIE 1931 2 Degree Standard Observer'],
+    'colorspaces': [],
+    'shape': [380, 780, 5],
+    'adaptation': None,
+    'reference': None,
+    'method': 'CIE 2000',
+    'cameras': [],
+    'idt_colorspace': None,
+    'chunk': 8,
+}
+
+# tysw は全 chunk を1ファイルに (ty_sweepfile.py を参照)
+FORMATS = ['npz', 'csv', 'tysw']
+
+#=================================#
+# Spec
+#=================================#
+def load_spec(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+
+    spec = dict(DEFAULT_SPEC)
+    spec.update(data)
+
+    return spec
+
+def check_spec(spec):
+    names = [
+        ('checkers', 'checkers'),
+        ('illuminants', 'illuminants'),
+        ('cmfs', 'cmfs'),
+        ('colorspaces', 'colorspaces'),
+        ('cameras', 'cameras'),
+    ]
+    for key, kind in names:
+        keys = ty_registry.names(kind)
+        for name in spec[key]:
+            if not name in keys:
+                logger.warning(f'{key}: "{name}" is not found.')
+                return False
+
+    for key in ['checkers', 'illuminants', 'cmfs']:
+        if not spec[key]:
+            logger.warning(f'{key} is empty.')
+            return False
+
+    reference = spec['reference']
+    if reference is not None and not reference in ty_registry.names('references'):
+        logger.warning(f'reference: "{reference}" is not found.')
+        return False
+
+    colorspace = spec['idt_colorspace']
+    if colorspace is not None and not colorspace in ty_registry.names('colorspaces'):
+        logger.warning(f'idt_colorspace: "{colorspace}" is not found.')
+        return False
+
+    return True
+
+def tasks(spec):
+    # checker x illuminant の塊ごとに1タスク
+    chunk = max(1, int(spec['chunk']))
+    illuminants = spec['illuminants']
+
+    for checker in spec['checkers']:
+        for i in range(0, len(illuminants), chunk):
+            task = dict(spec)
+            task['checker'] = checker
+            task['illuminants'] = illuminants[i:i + chunk]
+            task['illuminant_offset'] = i
+            yield task
+
+#=================================#
+# Worker
+#=================================#
+def run_task(task):
+    start = time.perf_counter()
+
+    sds = colour.characterisation.SDS_COLOURCHECKERS.get(task['checker'])
+    illuminants = [colour.SDS_ILLUMINANTS.get(name) for name in task['illuminants']]
+    cmfs = [colour.MSDS_CMFS.get(name) for name in task['cmfs']]
+    shape = task['shape']
+
+    # (illuminant, observer, patch, 3), 同じ中身のタスクは前回の結果を読む
+    xyz = ty_spectral.RESULTS.get(
+        ('sweep', sds, illuminants, cmfs, ty_spectral.shape_key(shape)),
+        lambda: ty_spectral.sweep([sds], illuminants, cmfs, shape)[0])
+    whitepoints = ty_spectral.sweep_whitepoints(illuminants, cmfs, shape)
+
+    result = {
+        'checker': np.array([task['checker']]),
+        'illuminants': np.array(task['illuminants']),
+        'cmfs': np.array(task['cmfs']),
+        'colorspaces': np.array(task['colorspaces'], dtype=str),
+        'patches': np.array(list(sds.keys())),
+        'shape': np.array(shape, dtype=np.float64),
+        'xyz': xyz,
+        'whitepoint': whitepoints,
+    }
+
+    if task['colorspaces']:
+        # (illuminant, observer, colorspace, patch, 3)
+        result['rgb'] = ty_spectral.RESULTS.get(
+            ('sweep_rgb', xyz, whitepoints, task['colorspaces'], task['adaptation']),
+            lambda: ty_colorimetry.sweep_to_RGB(
+                xyz[np.newaxis], whitepoints, task['colorspaces'], task['adaptation'])[0])
+
+    if task['reference'] is not None:
+        names, ref_xyz, ref_white = ty_colorimetry.reference(task['reference'])
+        index = ty_colorimetry.match(tuple(sds.keys()), names)
+        if index is None:
+            logger.warning(
+                f'{task["checker"]}: patches do not match "{task["reference"]}", '
+                f'delta_E is skipped.')
+        else:
+            # (illuminant, observer, patch)
+            result['delta_E'] = ty_colorimetry.delta_E(
+                xyz, whitepoints, ref_xyz[index], ref_white,
+                task['method'], task['adaptation'])
+
+    if task['cameras']:
+        # (illuminant, camera, patch, 3) / (illuminant, camera, 3, 3)
+        idt = ty_camera.idt(
+            [sds], illuminants, task['cameras'], shape, cmfs[0],
+            task['idt_colorspace'], task['adaptation'] or 'CAT02')
+        result['cameras'] = np.array(task['cameras'])
+        result['camera_rgb'] = idt['rgb']
+        result['idt'] = idt['matrix']
+        result['idt_residual'] = idt['residual']
+
+    result['time'] = np.array(time.perf_counter() - start)
+
+    return result
+
+#=================================#
+# Write
+#=================================#
+def write_npz(path, result):
+    np.savez(path, **result)
+
+def write_csv(path, result):
+    header = ['checker', 'illuminant', 'cmfs', 'colorspace', 'patch', 'X', 'Y', 'Z']
+    if 'rgb' in result:
+        header += ['R', 'G', 'B']
+    if 'delta_E' in result:
+        header += ['delta_E']
+
+    checker = str(result['checker'][0])
+    colorspaces = list(result['colorspaces']) or ['']
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+
+        for i, ilm in enumerate(result['illuminants']):
+            for o, cmfs in enumerate(result['cmfs']):
+                for s, colorspace in enumerate(colorspaces):
+                    for n, patch in enumerate(result['patches']):
+                        row = [checker, ilm, cmfs, colorspace, patch]
+                        row += result['xyz'][i, o, n].tolist()
+                        if 'rgb' in result:
+                            row += result['rgb'][i, o, s, n].tolist()
+                        if 'delta_E' in result:
+                            row.append(float(result['delta_E'][i, o, n]))
+                        writer.writerow(row)
+
+def write(output, index, result, fmt):
+    path = os.path.join(output, f'chunk_{index:05d}.{fmt}')
+    tmp = f'{path}.tmp'
+
+    # 書き終わるまで .tmp にしておく
+    if fmt == 'csv':
+        write_csv(tmp, result)
+    else:
+        with open(tmp, 'wb') as f:
+            write_npz(f, result)
+    os.replace(tmp, path)
+
+    return path
+
+#=================================#
+# Run
+#=================================#
+def run(spec, output, workers=None, fmt='npz'):
+    if not check_spec(spec):
+        return None
+
+    os.makedirs(output, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    items = list(tasks(spec))
+
+    logger.info(f'> Sweep = {len(items)} tasks / {workers} workers')
+    start = time.perf_counter()
+
+    writer = None
+    if fmt == 'tysw':
+        patches = {
+            name: list(colour.characterisation.SDS_COLOURCHECKERS.get(name).keys())
+            for name in spec['checkers']
+        }
+        writer = ty_sweepfile.SweepWriter(
+            os.path.join(output, f'sweep{ty_sweepfile.EXTENSION}'), spec, patches)
+
+    paths = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        # 投げるのは window 個まで, 終わったものは手放して結果を溜めない
+        window = workers * 2
+        pending = iter(enumerate(items))
+        futures = {}
+
+        def submit():
+            for index, task in pending:
+                futures[executor.submit(run_task, task)] = index
+                if len(futures) >= window:
+                    return
+
+        submit()
+
+        # 終わった順にディスクへ書き出す
+        while futures:
+            done, _ = concurrent.futures.wait(
+                futures, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for future in done:
+                index = futures.pop(future)
+                result = future.result()
+                if writer is not None:
+                    writer.write(result, items[index]['illuminant_offset'])
+                    paths[index] = writer.path()
+                else:
+                    paths[index] = write(output, index, result, fmt)
+
+                logger.info(
+                    f'[{len(paths)}/{len(items)}] {os.path.basename(paths[index])} '
+                    f'{float(result["time"]):.3f} sec')
+
+            submit()
+
+    chunks = [os.path.basename(paths[index]) for index in sorted(paths)]
+    if writer is not None:
+        writer.close()
+        chunks = [os.path.basename(writer.path())]
+
+    manifest = {
+        'spec': spec,
+        'format': fmt,
+        'chunks': chunks,
+        'time': time.perf_counter() - start,
+    }
+    with open(os.path.join(output, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4, ensure_ascii=False)
+
+    logger.info(f'> Done = {manifest["time"]:.3f} sec')
+
+    return manifest
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Headless colour checker sweep.')
+    parser.add_argument('spec', help='sweep spec (json)')
+    parser.add_argument('-o', '--output', default='sweep', help='output directory')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='number of processes (default: cpu count)')
+    parser.add_argument('-f', '--format', choices=FORMATS, default='npz')
+    args = parser.parse_args(argv)
+
+    spec = load_spec(args.spec)
+    result = run(spec, args.output, args.workers, args.format)
+
+    return 0 if result is not None else 1
+
+if __name__ == '__main__':
+    logging.basicConfig(level = logging.INFO)
+
+    sys.exit(main())
@@ -0,0 +1,244 @@
+import json
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# sweep 結果のバイナリ形式 (.tysw)
+#
+# [0:8]    MAGIC
+# [8:16]   header の長さ (uint64 little endian)
+# [16:]    header (json, utf-8)
+# ...      ALIGN 境界から配列を C order で隙間なく並べる
+#
+# header
+# {
+#     "version": 1,
+#     "axes": {
+#         "checker": [...], "illuminant": [...], "observer": [...],
+#         "colorspace": [...], "patch": [0, 1, ...]
+#     },
+#     "patches": { checker: [パッチ名, ...] },
+#     "arrays": {
+#         "xyz":        { "dtype": "<f4", "axes": ["checker", "illuminant", "observer", "patch", "xyz"], "shape": [...], "offset": ... },
+#         "whitepoint": (illuminant, observer, xyz)
+#         "rgb":        (checker, illuminant, observer, colorspace, patch, rgb)  colorspace がある時
+#         "delta_E":    (checker, illuminant, observer, patch)                   reference がある時
+#         "done":       (checker, illuminant) uint8, 書き終わった所が 1
+#     },
+#     "spec": { sweep の spec }
+# }
+#
+# 最初に全体の大きさでファイルを作り (sparse), chunk が終わるたびにその範囲へ書き込む
+# パッチ数が足りないチェッカーは NaN, done = 0 の所はまだ書かれていない
+MAGIC = b'TYSWEEP1'
+VERSION = 1
+ALIGN = 64
+EXTENSION = '.tysw'
+
+#=================================#
+# Header
+#=================================#
+def layout(axes, colorspaces, reference, dtype='<f4'):
+    c = len(axes['checker'])
+    i = len(axes['illuminant'])
+    o = len(axes['observer'])
+    n = len(axes['patch'])
+
+    arrays = {
+        'xyz': (dtype, ['checker', 'illuminant', 'observer', 'patch', 'xyz'], [c, i, o, n, 3]),
+        'whitepoint': (dtype, ['illuminant', 'observer', 'xyz'], [i, o, 3]),
+    }
+    if colorspaces:
+        arrays['rgb'] = (
+            dtype, ['checker', 'illuminant', 'observer', 'colorspace', 'patch', 'rgb'],
+            [c, i, o, len(colorspaces), n, 3])
+    if reference:
+        arrays['delta_E'] = (dtype, ['checker', 'illuminant', 'observer', 'patch'], [c, i, o, n])
+    arrays['done'] = ('|u1', ['checker', 'illuminant'], [c, i])
+
+    return {
+        name: {'dtype': dtype, 'axes': names, 'shape': shape}
+        for name, (dtype, names, shape) in arrays.items()
+    }
+
+def align(value):
+    return (value + ALIGN - 1) // ALIGN * ALIGN
+
+def encode_header(header):
+    # offset は header 自身の長さに依存するので、長さが落ち着くまで繰り返す
+    offset = 0
+    while True:
+        start = align(16 + offset)
+        for info in header['arrays'].values():
+            info['offset'] = start
+            size = int(np.prod(info['shape'])) * np.dtype(info['dtype']).itemsize
+            start = align(start + size)
+
+        data = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        if len(data) <= offset:
+            return data.ljust(offset), start
+        offset = align(len(data))
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        if f.read(8) != MAGIC:
+            logger.warning(f'"{path}" is not a sweep file.')
+            return None
+
+        length = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+        return json.loads(f.read(length).decode('utf-8'))
+
+#=================================#
+# Write
+#=================================#
+class SweepWriter:
+    def __init__(self, path, spec, patches, dtype='<f4'):
+        # patches = { checker: [パッチ名, ...] }
+        self._path = path
+        n = max(len(names) for names in patches.values())
+
+        axes = {
+            'checker': list(spec['checkers']),
+            'illuminant': list(spec['illuminants']),
+            'observer': list(spec['cmfs']),
+            'colorspace': list(spec['colorspaces']),
+            'patch': list(range(n)),
+        }
+        self._header = {
+            'version': VERSION,
+            'axes': axes,
+            'patches': { name: list(patches[name]) for name in axes['checker'] },
+            'arrays': layout(axes, spec['colorspaces'], spec.get('reference')),
+            'spec': spec,
+        }
+
+        data, size = encode_header(self._header)
+
+        # 中身は書かずに大きさだけ確保 (sparse)
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(np.array([len(data)], dtype='<u8').tobytes())
+            f.write(data)
+            f.truncate(size)
+
+        self._arrays = {
+            name: np.memmap(path, dtype=info['dtype'], mode='r+',
+                            offset=info['offset'], shape=tuple(info['shape']))
+            for name, info in self._header['arrays'].items()
+        }
+
+    def path(self):
+        return self._path
+
+    def header(self):
+        return self._header
+
+    def write(self, result, illuminant_offset=0):
+        # ty_sweep.run_task の結果 (1 checker x illuminant の chunk) を書き込む
+        axes = self._header['axes']
+        c = axes['checker'].index(str(result['checker'][0]))
+        i0 = illuminant_offset
+        i1 = i0 + len(result['illuminants'])
+        n = len(result['patches'])
+
+        def put(name, patch_axis):
+            if not name in self._arrays:
+                return
+            target = self._arrays[name][c, i0:i1]
+
+            # 結果に無い時 (reference とパッチが合わない時の delta_E など) は
+            # ファイルの初期値 0 のままにせず NaN にする
+            if not name in result:
+                target[...] = np.nan
+                return
+
+            index = (slice(None), ) * patch_axis
+            target[index + (slice(0, n), )] = result[name]
+            target[index + (slice(n, None), )] = np.nan
+
+        put('xyz', 2)
+        put('rgb', 3)
+        put('delta_E', 2)
+
+        self._arrays['whitepoint'][i0:i1] = result['whitepoint']
+
+        # 値を書いてから done を立てる
+        for name, array in self._arrays.items():
+            if name != 'done':
+                array.flush()
+        self._arrays['done'][c, i0:i1] = 1
+        self._arrays['done'].flush()
+
+    def close(self):
+        for array in self._arrays.values():
+            array.flush()
+        self._arrays = {}
+
+#=================================#
+# Read
+#=================================#
+class SweepFile:
+    # 配列は memory map なので、スライスした所だけ読む
+    def __init__(self, path):
+        self._path = path
+        self._header = read_header(path)
+        self._arrays = {}
+
+    def __contains__(self, name):
+        return name in self._header['arrays']
+
+    def path(self):
+        return self._path
+
+    def header(self):
+        return self._header
+
+    def axes(self, name=None):
+        # name を指定したらその配列の軸名
+        if name is None:
+            return self._header['axes']
+
+        return self._header['arrays'][name]['axes']
+
+    def labels(self, axis):
+        return self._header['axes'][axis]
+
+    def index(self, axis, label):
+        return self._header['axes'][axis].index(label)
+
+    def patches(self, checker):
+        return self._header['patches'][checker]
+
+    def spec(self):
+        return self._header['spec']
+
+    def array(self, name):
+        if not name in self._arrays:
+            info = self._header['arrays'][name]
+            self._arrays[name] = np.memmap(
+                self._path, dtype=info['dtype'], mode='r',
+                offset=info['offset'], shape=tuple(info['shape']))
+
+        return self._arrays[name]
+
+    def select(self, name, **labels):
+        # select('xyz', checker='ISO 17321-1', illuminant='D65') のように名前で切り出す
+        index = []
+        for axis in self.axes(name):
+            if axis in labels:
+                index.append(self.index(axis, labels[axis]))
+            else:
+                index.append(slice(None))
+
+        return self.array(name)[tuple(index)]
+
+    def done(self):
+        return np.asarray(self.array('done'), dtype=bool)
+
+def open_sweep(path):
+    result = SweepFile(path)
+    if result.header() is None:
+        return None
+
+    return result
@@ -0,0 +1,200 @@
+import logging
+import os
+import numpy as np
+
+import ty_colorimetry
+import ty_registry
+
+colour = ty_registry.colour
+
+logger = logging.getLogger(__name__)
+
+# xyY / sRGB しかないチェッカーを SD にして Checker に渡す
+#
+# D65 の反射率として求めるので、xyY は D65 に色順応してから使う
+# Jakob 2019 は1色ごとに最適化するので、求めた係数をディスクにキャッシュする
+METHODS = ['Jakob 2019', 'Otsu 2018', 'Smits 1999']
+
+SHAPE = (360, 780, 5)
+ADAPTATION = 'Bradford'
+
+#=================================#
+# Cache
+#=================================#
+def cache_dir():
+    return os.path.join(ty_registry.cache_dir(), 'upsampling')
+
+def xyz_key(xyz):
+    return tuple(np.round(np.asarray(xyz, dtype=np.float64), 8).tolist())
+
+class CoefficientCache:
+    # XYZ -> Jakob 2019 の係数 (3, ), npz に全部まとめて保存
+    def __init__(self, name):
+        self._name = name
+        self._data = None
+
+    def path(self):
+        return os.path.join(cache_dir(), self._name)
+
+    def data(self):
+        if self._data is None:
+            self._data = self.load()
+
+        return self._data
+
+    def load(self):
+        path = self.path()
+        if not os.path.exists(path):
+            return {}
+
+        try:
+            with np.load(path) as f:
+                return { xyz_key(x): c for x, c in zip(f['xyz'], f['coefficients']) }
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f'Failed to read "{path}": {e}')
+            return {}
+
+    def save(self):
+        data = self.data()
+        path = self.path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                np.savez(
+                    f,
+                    xyz=np.array(list(data.keys())).reshape(-1, 3),
+                    coefficients=np.array(list(data.values())).reshape(-1, 3),
+                )
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f'Failed to write "{path}": {e}')
+
+    def get(self, xyz):
+        # (N, 3) -> (N, 3), 無いものだけ最適化して保存
+        data = self.data()
+        keys = [xyz_key(x) for x in xyz]
+
+        missing = [i for i, key in enumerate(keys) if not key in data]
+        if missing:
+            logger.info(f'> Solve Jakob 2019 = {len(missing)} colours')
+            for i in missing:
+                coefficients, _ = colour.recovery.find_coefficients_Jakob2019(xyz[i])
+                data[keys[i]] = np.asarray(coefficients, dtype=np.float64)
+            self.save()
+
+        return np.array([data[key] for key in keys])
+
+    def clear(self):
+        self._data = {}
+        path = self.path()
+        if os.path.exists(path):
+            os.remove(path)
+
+COEFFICIENTS = CoefficientCache('jakob2019.npz')
+
+_LUTS = {}
+
+def lut_Jakob2019(colorspace='sRGB', size=64):
+    # RGB -> 係数の 3D テーブル, 作るのに非常に時間がかかるので .coeff で保存
+    key = (colorspace, size)
+    if key in _LUTS:
+        return _LUTS[key]
+
+    path = os.path.join(cache_dir(), f'jakob2019_{colorspace}_{size}.coeff')
+    lut = colour.recovery.LUT3D_Jakob2019()
+
+    if os.path.exists(path):
+        lut.read(path)
+    else:
+        logger.info(f'> Generate Jakob 2019 LUT = {colorspace} / {size}')
+        lut.generate(colour.RGB_COLOURSPACES[colorspace], size=size, print_callable=logger.debug)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lut.write(path)
+
+    _LUTS[key] = lut
+    return lut
+
+#=================================#
+# Input
+#=================================#
+def reference_xyz(name):
+    # CCS_COLOURCHECKERS -> (names, (N, 3) D65 の XYZ)
+    names, xyz, whitepoint = ty_colorimetry.reference(name)
+    d65 = ty_colorimetry.colorspace_whitepoint('sRGB')
+
+    xyz = colour.adaptation.chromatic_adaptation_VonKries(
+        xyz, whitepoint, d65, transform=ADAPTATION)
+
+    return names, xyz
+
+def srgb_xyz(rgb):
+    # sRGB (0 - 1, cctf 付き) -> (N, 3) D65 の XYZ
+    rgb = colour.RGB_COLOURSPACES['sRGB'].cctf_decoding(np.asarray(rgb, dtype=np.float64))
+    return ty_colorimetry.RGB_to_XYZ(rgb, 'sRGB')
+
+#=================================#
+# Upsample
+#=================================#
+def sds_coefficients(names, coefficients):
+    # S(λ) = sigmoid(c0 λ^2 + c1 λ + c2) をまとめて計算
+    c = np.asarray(coefficients, dtype=np.float64)
+    wavelengths = colour.SpectralShape(*SHAPE).wavelengths
+
+    x = c[:, 0:1] * wavelengths ** 2 + c[:, 1:2] * wavelengths + c[:, 2:3]
+    values = 0.5 + x / (2 * np.sqrt(1 + x ** 2))
+
+    return {
+        name: colour.SpectralDistribution(v, wavelengths, name=name)
+        for name, v in zip(names, values)
+    }
+
+def sds_Jakob2019(names, xyz):
+    return sds_coefficients(names, COEFFICIENTS.get(np.asarray(xyz, dtype=np.float64)))
+
+def sds_Otsu2018(names, xyz):
+    result = {}
+    for name, x in zip(names, xyz):
+        sd = colour.recovery.XYZ_to_sd_Otsu2018(x)
+        sd.name = name
+        result[name] = sd
+
+    return result
+
+def sds_Smits1999(names, xyz):
+    # Smits は linear sRGB から
+    rgb = ty_colorimetry.XYZ_to_RGB(np.asarray(xyz, dtype=np.float64), 'sRGB')
+
+    result = {}
+    for name, value in zip(names, rgb):
+        sd = colour.recovery.RGB_to_sd_Smits1999(value)
+        sd.name = name
+        result[name] = sd
+
+    return result
+
+def XYZ_to_sds(names, xyz, method='Jakob 2019'):
+    # (N, 3) D65 の XYZ (Y = 1.0) -> { name: SpectralDistribution }
+    funcs = {
+        'Jakob 2019': sds_Jakob2019,
+        'Otsu 2018': sds_Otsu2018,
+        'Smits 1999': sds_Smits1999,
+    }
+    if not method in funcs:
+        logger.warning(f'"{method}" is not found.')
+        return None
+
+    return funcs[method](names, xyz)
+
+def reference_sds(name, method='Jakob 2019'):
+    names, xyz = reference_xyz(name)
+    return XYZ_to_sds(names, xyz, method)
+
+def srgb_sds(names, rgb, method='Jakob 2019', lut_size=None):
+    # lut_size を指定したら Jakob 2019 の係数は 3D テーブルから引く
+    if method == 'Jakob 2019' and lut_size is not None:
+        rgb = colour.RGB_COLOURSPACES['sRGB'].cctf_decoding(np.asarray(rgb, dtype=np.float64))
+        lut = lut_Jakob2019('sRGB', lut_size)
+        return sds_coefficients(names, lut.RGB_to_coefficients(rgb))
+
+    return XYZ_to_sds(names, srgb_xyz(rgb), method)